@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import functools
+import multiprocessing
+
+from hugin.flowcell_monitor import FlowcellMonitor, BoardError, BOARD_KEY, LEASE_KEY, FC_NAME_RE
+from hugin.flowcell_status import FlowcellStatus
+from hugin.flowcells import Flowcell
+from hugin.lease import LeaseLost
+from hugin.snapshots import flowcell_snapshot, FlowcellSnapshot
+
+# number of run folders handed to a worker at a time
+DEFAULT_CHUNKSIZE = 16
+
+
+def parse_run_folder(flowcell_path, server=None):
+    # runs in a worker process: returns the snapshot of the run or the error it failed with
+    try:
+        status = FlowcellStatus(flowcell_path)
+        flowcell = Flowcell.init_flowcell(status, server=server)
+        snapshot = flowcell_snapshot(flowcell)
+        snapshot['path'] = flowcell_path
+    except Exception as e:
+        return {'path': flowcell_path, 'error': '{}: {}'.format(e.__class__.__name__, e)}
+    return {'path': flowcell_path, 'snapshot': snapshot}
+
+
+class FlowcellBackfill(FlowcellMonitor):
+    # parses the metadata of the finished run folders in nosync in a process pool and creates their missing cards.
+    # Running runs are left to the monitor, which also keeps the status of the existing cards up to date.
+    # Every result is appended to a checkpoint file as soon as it arrives, so an interrupted backfill
+    # continues where it stopped and the results never have to fit in memory at once
+    def __init__(self, config, checkpoint_path=None):
+        super(FlowcellBackfill, self).__init__(config)
+        self._checkpoint_path = checkpoint_path
+
+    @property
+    def checkpoint_path(self):
+        return self._checkpoint_path or os.path.join(self.state_dir, 'backfill.jsonl')
+
+    @property
+    def applied_path(self):
+        return '{}.applied'.format(self.checkpoint_path)
+
+    def run_folders(self, data_folders=None):
+        for data_folder in data_folders or self.data_folders:
+            folder = os.path.join(data_folder, 'nosync')
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                flowcell_path = os.path.join(folder, name)
+                if re.match(FC_NAME_RE, name) and os.path.isdir(flowcell_path):
+                    yield flowcell_path
+
+    def results(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # the last line of an interrupted backfill
+                    continue
+
+    def parse(self, data_folders=None, processes=None, chunksize=DEFAULT_CHUNKSIZE, progress=None):
+        # failed run folders are parsed again in the next backfill
+        done = set(result['path'] for result in self.results() if 'snapshot' in result)
+        pending = (path for path in self.run_folders(data_folders) if path not in done)
+
+        folder = os.path.dirname(self.checkpoint_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        counts = {'parsed': 0, 'failed': 0, 'skipped': len(done)}
+        pool = multiprocessing.Pool(processes)
+        try:
+            with open(self.checkpoint_path, 'a') as checkpoint:
+                worker = functools.partial(parse_run_folder, server=self.hostname)
+                for result in pool.imap_unordered(worker, pending, chunksize):
+                    checkpoint.write('{}\n'.format(json.dumps(result, sort_keys=True)))
+                    counts['failed' if 'error' in result else 'parsed'] += 1
+                    if progress is not None:
+                        progress(result, counts)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return counts
+
+    def apply(self, progress=None):
+        # create the missing cards of all parsed run folders which have not been applied before
+        applied = set()
+        if os.path.exists(self.applied_path):
+            with open(self.applied_path) as applied_file:
+                applied = set(line.strip() for line in applied_file)
+
+        self._skipped = []
+        self._reset_board_cache()
+        counts = {'applied': 0, 'skipped': len(applied)}
+        try:
+            with open(self.applied_path, 'a') as applied_file:
+                for result in self.results():
+                    snapshot = result.get('snapshot')
+                    if snapshot is None or snapshot['name'] in applied:
+                        continue
+                    if self._run_isolated(snapshot['path'], self._apply_snapshot, snapshot):
+                        applied.add(snapshot['name'])
+                        applied_file.write('{}\n'.format(snapshot['name']))
+                        applied_file.flush()
+                        counts['applied'] += 1
+                        if progress is not None:
+                            progress(snapshot, counts)
+        except BoardError as e:
+            self._skipped.append((BOARD_KEY, 'backfill aborted: {}'.format(e)))
+        except LeaseLost as e:
+            self._skipped.append((LEASE_KEY, 'backfill aborted: {}'.format(e)))
+        finally:
+            if not self._lease_lost():
+                self.retry_queue.save()
+        return counts
+
+    def _apply_snapshot(self, snapshot):
+        # a snapshot may be days old, an existing card is never moved back to its list
+        if self._get_card_by_name(snapshot['name']) is None:
+            self._create_card(FlowcellSnapshot(snapshot))
+        return True
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+
+from hugin import profiling
+from hugin.json_file import write_json
+from hugin.flowcell_monitor import FlowcellMonitor, BoardError, BOARD_KEY, LEASE_KEY
+from hugin.lease import LeaseLost
+from hugin.flowcell_status import FC_STATUSES
+from hugin.snapshots import flowcell_snapshot, FlowcellSnapshot, SnapshotSpool, DEFAULT_SPOOL_DIR
+
+# flowcells missing from the snapshots of a host are only archived if the host has written them recently
+DEFAULT_STALE_AFTER = 60 * 60
+
+
+def get_spool(config):
+    return SnapshotSpool(os.path.expanduser(config.get('spool_dir', DEFAULT_SPOOL_DIR)))
+
+
+class FlowcellAgent(FlowcellMonitor):
+    # runs on a preprocessing server: checks the local flowcells like FlowcellMonitor, but writes their snapshots
+    # to the spool directory of the collector instead of reading and writing the Trello board
+    def __init__(self, config):
+        super(FlowcellAgent, self).__init__(config)
+        self._spool = None
+        # snapshots written in the previous and in the current pass, by flowcell name
+        self._previous = {}
+        self._snapshots = {}
+
+    @property
+    def spool(self):
+        if self._spool is None:
+            self._spool = get_spool(self.config)
+        return self._spool
+
+    @property
+    def state_dir(self):
+        # agents on the same machine or with a shared home folder do not overwrite each other's state
+        return os.path.join(super(FlowcellAgent, self).state_dir, self.hostname)
+
+    @property
+    def lease_name(self):
+        return 'agent-{}'.format(self.hostname)
+
+    def update_spool(self):
+        previous = self.spool.read_host(self.hostname) or {}
+        self._previous = dict((snapshot['name'], snapshot) for snapshot in previous.get('flowcells', []))
+        self._snapshots = {}
+        skipped = self._run_pass()
+
+        # keep the last known state of skipped flowcells, otherwise the collector would take them as removed
+        self._carry_over_skipped(self._previous, self._snapshots)
+        self.spool.write(self.hostname, self._snapshots.values())
+        self._flowcell_states = self._snapshots
+        return skipped
+
+    def _update_card(self, flowcell):
+        snapshot = flowcell_snapshot(flowcell)
+        snapshot['path'] = flowcell.path
+        self._snapshots[flowcell.full_name] = snapshot
+
+    def _check_nosync_flowcell(self, flowcell_path):
+        name = os.path.basename(flowcell_path)
+        previous = self._previous.get(name)
+        # flowcells in nosync do not change any more, no need to parse them again
+        if previous is not None and previous['trello_list'] == FC_STATUSES['NOSYNC']:
+            self._snapshots[name] = previous
+        else:
+            self._update_card(self._load_flowcell(flowcell_path))
+
+    def _check_archived_flowcells(self, data_folder, nosync_paths):
+        # the collector archives the flowcells which disappear from the snapshots
+        pass
+
+
+class FlowcellCollector(FlowcellMonitor):
+    # merges the snapshots of all agents and brings the Trello board up to date in one sync, touching only
+    # the cards whose snapshot has changed since the previous sync
+    def __init__(self, config):
+        super(FlowcellCollector, self).__init__(config)
+        self._spool = None
+        self._synced = None
+
+    @property
+    def spool(self):
+        if self._spool is None:
+            self._spool = get_spool(self.config)
+        return self._spool
+
+    @property
+    def stale_after(self):
+        return self.config.get('collector', {}).get('stale_after', DEFAULT_STALE_AFTER)
+
+    @property
+    def synced_path(self):
+        return os.path.join(self.state_dir, 'collector_synced.json')
+
+    @property
+    def synced(self):
+        # snapshots as they are on the board, by flowcell name
+        if self._synced is None:
+            self._synced = {}
+            if os.path.exists(self.synced_path):
+                with open(self.synced_path) as synced_file:
+                    try:
+                        self._synced = json.load(synced_file)
+                    except ValueError:
+                        # every flowcell is synced once more
+                        self._synced = {}
+        return self._synced
+
+    def update_trello_board(self):
+        started = time.time()
+        self._skipped = []
+        self._reset_board_cache()
+        try:
+            self._sync(started)
+        except BoardError as e:
+            self._skipped.append((BOARD_KEY, 'pass aborted: {}'.format(e)))
+        except LeaseLost as e:
+            self._skipped.append((LEASE_KEY, 'pass aborted: {}'.format(e)))
+        finally:
+            if not self._lease_lost():
+                self.retry_queue.save()
+                self._save_synced()
+        self._flowcell_states = dict(self.synced)
+        self._pass_metrics = {
+            'pass_started_seconds': started,
+            'pass_duration_seconds': time.time() - started,
+            'skipped_flowcells': len(self.skipped),
+        }
+        return self.skipped
+
+    def _sync(self, now):
+        for host, data in self.spool.read().items():
+            current = dict((snapshot['name'], snapshot) for snapshot in data['flowcells'])
+            for name, snapshot in sorted(current.items()):
+                if self.synced.get(name) != snapshot and self._run_isolated(name, self._sync_flowcell, snapshot):
+                    self.synced[name] = snapshot
+
+            # an agent which has stopped writing does not mean that its flowcells are gone
+            if now - data['time'] > self.stale_after:
+                continue
+            for name, snapshot in sorted(self.synced.items()):
+                if snapshot['server'] == host and name not in current:
+                    if self._run_isolated(name, self._archive_flowcell, snapshot):
+                        del self.synced[name]
+
+    def _sync_flowcell(self, snapshot):
+        self._update_card(FlowcellSnapshot(snapshot))
+        return True
+
+    def _archive_flowcell(self, snapshot):
+        # only flowcells deleted from the nosync folder are archived
+        if snapshot['trello_list'] == FC_STATUSES['NOSYNC']:
+            card = self._get_card_by_name(snapshot['name'])
+            if card is not None:
+                archived_list = self._get_list_by_name(FC_STATUSES['ARCHIVED'])
+                with profiling.phase('trello.change_list'):
+                    card.change_list(archived_list.id)
+        return True
+
+    def _save_synced(self):
+        if self._synced is None:
+            return
+        write_json(self.synced_path, self._synced, indent=2, sort_keys=True)
@@ -0,0 +1,235 @@
+import os
+import json
+import math
+import datetime
+
+from hugin.json_file import write_json
+
+# cold-start priors, used until enough runs of an instrument/run mode have completed
+CYCLE_DURATION = {
+    'RapidRun'          : datetime.timedelta(minutes=12),
+    'HighOutput'        : datetime.timedelta(minutes=100),
+    'RapidHighOutput'   : datetime.timedelta(minutes=43),
+    'MiSeq'             : datetime.timedelta(minutes=6),
+    'HiSeqX'            : datetime.timedelta(minutes=10),
+}
+# instruments and run modes without a prior of their own get the cycle time of the HiSeq X,
+# so that a new instrument shows up with a rough due time instead of failing the whole table
+DEFAULT_CYCLE_DURATION = CYCLE_DURATION['HiSeqX']
+
+DURATIONS = {
+    'DEMULTIPLEXING'    : datetime.timedelta(hours=4),
+    'TRANSFERING'       : datetime.timedelta(hours=12)
+}
+
+# kinds of durations kept in the table
+CYCLE = 'CYCLE'
+DEMULTIPLEXING = 'DEMULTIPLEXING'
+TRANSFERING = 'TRANSFERING'
+
+# number of completed runs before the learned values replace the priors
+DEFAULT_MIN_SAMPLES = 10
+# quantile used as the 'takes too long' threshold
+THRESHOLD_QUANTILE = 0.95
+
+
+class RunningStats(object):
+    # count, mean and variance (Welford) and one quantile (P-square algorithm by Jain and Chlamtac),
+    # all updated in O(1) time and memory per value
+    def __init__(self, quantile=THRESHOLD_QUANTILE):
+        self.p = quantile
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # P-square markers: heights, actual and desired positions
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def quantile(self):
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            heights = sorted(self.heights)
+            return heights[min(int(self.p * len(heights)), len(heights) - 1)]
+        return self.heights[2]
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count <= 5:
+            self.heights.append(value)
+            if self.count == 5:
+                self.heights.sort()
+            return
+        self._add_quantile(value)
+
+    def _add_quantile(self, value):
+        heights = self.heights
+        positions = self.positions
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        increments = [0, self.p / 2, self.p, (1 + self.p) / 2, 1]
+        for i in range(5):
+            self.desired[i] += increments[i]
+
+        # adjust the heights of the middle markers if they are off their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / float(positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        heights = self.heights
+        positions = self.positions
+        return heights[i] + d / float(positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / float(positions[i + 1] - positions[i]) +
+            (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / float(positions[i] - positions[i - 1]))
+
+    def to_dict(self):
+        return {
+            'p': self.p,
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'heights': self.heights,
+            'positions': self.positions,
+            'desired': self.desired,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['p'])
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        stats.heights = data['heights']
+        stats.positions = data['positions']
+        stats.desired = data['desired']
+        return stats
+
+
+class DurationTable(object):
+    # durations of cycles, demultiplexing and transferring per instrument and run mode, learned from completed
+    # runs and kept in a local json file. Without a path the table only returns the priors
+    def __init__(self, path=None, min_samples=DEFAULT_MIN_SAMPLES):
+        self._path = path
+        self._min_samples = min_samples
+        # initialize None values for @property functions
+        self._stats = None
+        self._recorded = None
+        self._changed = False
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            self._load()
+        return self._stats
+
+    @property
+    def recorded(self):
+        if self._recorded is None:
+            self._load()
+        return self._recorded
+
+    def prior(self, kind, instrument=None, run_mode=None):
+        if kind == CYCLE:
+            return CYCLE_DURATION.get(run_mode) or CYCLE_DURATION.get(instrument) or DEFAULT_CYCLE_DURATION
+        return DURATIONS[kind]
+
+    def get(self, kind, instrument=None, run_mode=None):
+        stats = self.stats.get(self._key(kind, instrument, run_mode))
+        if stats is None or stats.count < self._min_samples:
+            return None
+        return stats
+
+    def expected(self, kind, instrument=None, run_mode=None):
+        stats = self.get(kind, instrument, run_mode)
+        if stats is None:
+            return self.prior(kind, instrument, run_mode)
+        return datetime.timedelta(seconds=stats.mean)
+
+    def threshold(self, kind, instrument=None, run_mode=None):
+        stats = self.get(kind, instrument, run_mode)
+        if stats is None:
+            return self.prior(kind, instrument, run_mode)
+        return datetime.timedelta(seconds=max(stats.quantile, stats.mean))
+
+    def observe(self, run_id, kind, instrument, run_mode, duration):
+        # every run is counted once per kind, however many passes see it completed
+        kinds = self.recorded.setdefault(run_id, [])
+        if kind in kinds:
+            return False
+        kinds.append(kind)
+        key = self._key(kind, instrument, run_mode)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RunningStats()
+        stats.add(duration.total_seconds())
+        self._changed = True
+        return True
+
+    def prune(self, run_ids):
+        # runs which are not running any more are never observed again, only their stats are kept
+        for run_id in [run_id for run_id in self.recorded if run_id not in run_ids]:
+            del self.recorded[run_id]
+            self._changed = True
+
+    def save(self):
+        if not self._changed or not self.path:
+            return
+        data = {
+            'stats': dict((key, stats.to_dict()) for key, stats in self.stats.items()),
+            'recorded': self.recorded,
+        }
+        write_json(self.path, data, indent=2, sort_keys=True)
+        self._changed = False
+
+    def _key(self, kind, instrument, run_mode):
+        return '{}/{}/{}'.format(kind, instrument or '', run_mode or '')
+
+    def _load(self):
+        self._stats = {}
+        self._recorded = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as table_file:
+                try:
+                    data = json.load(table_file)
+                except ValueError:
+                    # start over with the priors
+                    return
+            self._stats = dict((key, RunningStats.from_dict(stats)) for key, stats in data.get('stats', {}).items())
+            self._recorded = data.get('recorded', {})
@@ -0,0 +1,86 @@
+import time
+
+from hugin.flowcell_status import FC_STATUSES
+
+
+# in-memory stand-in for a trello.Board with the lists of FC_STATUSES, for tests and the replay harness.
+# Every API call is recorded: calls has the call names, history has (time, call name, card name or None)
+# and moves has (time, card name, list id) for every card added to or moved between lists
+class FakeItem(object):
+    def __init__(self, board, **kwargs):
+        self.board = board
+        self.__dict__.update(kwargs)
+
+
+class FakeCard(FakeItem):
+    def set_description(self, description):
+        self.board.record('set_description', self)
+        self.description = description
+
+    def change_list(self, list_id):
+        self.board.record('change_list', self)
+        self.list_id = list_id
+        self.board.moves.append((self.board.now(), self.name, list_id))
+
+    def set_due(self, due):
+        self.board.record('set_due', self)
+        self.due = due
+
+    def comment(self, text):
+        self.board.record('comment', self)
+        self.comments.append(text)
+
+    def add_label(self, label):
+        self.board.record('add_label', self)
+        self.labels.append(label)
+
+
+class FakeList(FakeItem):
+    def add_card(self, name, desc=None):
+        card = FakeCard(self.board, id=name, name=name, description=desc or '', list_id=self.id, labels=[], comments=[], due=None)
+        self.board.cards.append(card)
+        self.board.record('add_card', card)
+        self.board.moves.append((self.board.now(), card.name, card.list_id))
+        return card
+
+
+class FakeBoard(object):
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.calls = []
+        self.history = []
+        self.moves = []
+        self.cards = []
+        self.labels = []
+        self.lists = [FakeList(self, id=name, name=name) for name in FC_STATUSES.values()]
+
+    def now(self):
+        return self._clock()
+
+    def record(self, call, card=None):
+        self.calls.append(call)
+        self.history.append((self.now(), call, card.name if card is not None else None))
+
+    def get_card(self, name):
+        for card in self.cards:
+            if card.name == name:
+                return card
+        return None
+
+    def all_cards(self):
+        self.record('all_cards')
+        return list(self.cards)
+
+    def all_lists(self):
+        self.record('all_lists')
+        return list(self.lists)
+
+    def get_labels(self):
+        self.record('get_labels')
+        return list(self.labels)
+
+    def add_label(self, name, color):
+        self.record('add_label')
+        label = FakeItem(self, id=name, name=name, color=color)
+        self.labels.append(label)
+        return label
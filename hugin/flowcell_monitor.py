@@ -1,13 +1,24 @@
 import os
 import re
+import time
 import socket
 
 import trello
-from hugin.flowcells import Flowcell
-from flowcell_status import FlowcellStatus, FC_STATUSES
+from hugin.flowcells import Flowcell, cycle_times_file, read_flowcell_cycle_times
+from hugin.flowcell_table import FlowcellTable
+from hugin.retry_queue import RetryQueue
+from hugin.lease import Lease, LeaseLost
+from hugin.transfer_log import TransferLog, DEFAULT_TRANSFER_LOG
+from hugin.durations import DurationTable, DEFAULT_MIN_SAMPLES
+from hugin.samplesheet import SampleSheetCache
+from hugin.snapshots import flowcell_state
+from hugin.flowcell_status import FlowcellStatus, FC_STATUSES
+from hugin import profiling
 
 FC_NAME_RE = r'(\d{6})_([ST-]*\w+\d+)_\d+_([AB]?)([A-Z0-9\-]+)'
 
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser('~'), '.hugin')
+
 COLORS = [
     'red',
     'blue',
@@ -21,6 +32,19 @@ COLORS = [
     'black'
 ]
 
+# retry key of reading a running flowcell into the table is its path with this suffix
+REFRESH_KEY_SUFFIX = '#refresh'
+
+# keys of the skipped entries of a pass aborted because the board cannot be read or the lease has been lost
+BOARD_KEY = 'trello'
+LEASE_KEY = 'lease'
+
+
+class BoardError(RuntimeError):
+    # the Trello board cannot be read. The pass is aborted instead of charging the failure to every flowcell
+    pass
+
+
 class FlowcellMonitor(object):
     def __init__(self, config):
         self._config = config
@@ -29,11 +53,100 @@ class FlowcellMonitor(object):
         self._data_folders = None
         self._trello_cards = None
         self._trello_lists = None
+        self._trello_labels = None
+        self._retry_queue = None
+        self._transfer_log = None
+        self._durations = None
+        self._samplesheets = None
+        self._flowcell_table = None
+        self._lease = None
+        # runs found in the data folders in the current pass
+        self._seen_runs = set()
+        # retry queue keys of everything checked in the current pass
+        self._checked_keys = set()
+        # flowcells (or data folders) skipped in the current pass and why
+        self._skipped = []
+        # state of all flowcells and timings of the last pass, e.g. for the status server
+        self._flowcell_states = {}
+        self._pass_metrics = {}
 
     @property
     def config(self):
         return self._config
 
+    @property
+    def hostname(self):
+        return self.config.get('hostname') or socket.gethostname()
+
+    @property
+    def state_dir(self):
+        return os.path.expanduser(self.config.get('state_dir', DEFAULT_STATE_DIR))
+
+    @property
+    def retry_queue(self):
+        if self._retry_queue is None:
+            config = self.config.get('retry_queue', {})
+            path = config.get('path', os.path.join(self.state_dir, 'retry_queue.json'))
+            kwargs = dict((key, config[key]) for key in ('base_delay', 'max_delay') if key in config)
+            self._retry_queue = RetryQueue(os.path.expanduser(path), **kwargs)
+        return self._retry_queue
+
+    @property
+    def transfer_log(self):
+        if self._transfer_log is None:
+            path = os.path.expanduser(self.config.get('transfer_log', DEFAULT_TRANSFER_LOG))
+            self._transfer_log = TransferLog(path, index_path=os.path.join(self.state_dir, 'transfer_log.json'))
+        return self._transfer_log
+
+    @property
+    def durations(self):
+        if self._durations is None:
+            config = self.config.get('durations', {})
+            path = config.get('path', os.path.join(self.state_dir, 'durations.json'))
+            min_samples = config.get('min_samples', DEFAULT_MIN_SAMPLES)
+            self._durations = DurationTable(os.path.expanduser(path), min_samples=min_samples)
+        return self._durations
+
+    @property
+    def samplesheets(self):
+        if self._samplesheets is None:
+            self._samplesheets = SampleSheetCache(os.path.join(self.state_dir, 'samplesheets.json'))
+        return self._samplesheets
+
+    @property
+    def flowcell_table(self):
+        # kept for the lifetime of the monitor, so a watching monitor parses the XML files of a run only once
+        if self._flowcell_table is None:
+            self._flowcell_table = FlowcellTable(server=self.hostname, samplesheets=self.samplesheets, load_flowcell=self._load_flowcell)
+        return self._flowcell_table
+
+    @property
+    def lease_name(self):
+        # one lease per board, so that monitors with different config files still exclude each other
+        board_id = (self.config.get('trello') or {}).get('board_id', 'default')
+        return 'monitor-{}'.format(board_id)
+
+    @property
+    def lease(self):
+        if self._lease is None:
+            config = self.config.get('lease', {})
+            path = config.get('path', os.path.join(self.state_dir, '{}.lease'.format(self.lease_name)))
+            kwargs = dict((key, config[key]) for key in ('ttl', 'heartbeat_interval') if key in config)
+            self._lease = Lease(os.path.expanduser(path), **kwargs)
+        return self._lease
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    @property
+    def flowcell_states(self):
+        return self._flowcell_states
+
+    @property
+    def pass_metrics(self):
+        return self._pass_metrics
+
     @property
     def trello_board(self):
         if not self._trello_board:
@@ -48,7 +161,7 @@ class FlowcellMonitor(object):
             api_secret = config.get('api_secret')
             client = trello.TrelloClient(api_key=api_key, token=token, api_secret=api_secret)
             board_id = config.get('board_id')
-            self._trello_board  = client.get_board(board_id)
+            self._trello_board = self._read_board('trello.get_board', client.get_board, board_id)
 
         return self._trello_board
 
@@ -63,72 +176,245 @@ class FlowcellMonitor(object):
     @property
     def trello_cards(self):
         if self._trello_cards is None:
-            self._trello_cards = self.trello_board.all_cards()
+            self._trello_cards = self._read_board('trello.all_cards', self.trello_board.all_cards)
         return self._trello_cards
 
     @property
     def trello_lists(self):
         if self._trello_lists is None:
-            self._trello_lists = self.trello_board.all_lists()
+            self._trello_lists = self._read_board('trello.all_lists', self.trello_board.all_lists)
         return self._trello_lists
 
+    @property
+    def trello_labels(self):
+        if self._trello_labels is None:
+            self._trello_labels = self._read_board('trello.get_labels', self.trello_board.get_labels) or []
+        return self._trello_labels
+
+    def _read_board(self, phase, read, *args):
+        try:
+            with profiling.phase(phase):
+                return read(*args)
+        except Exception as e:
+            raise BoardError('Cannot read the Trello board: {}: {}'.format(e.__class__.__name__, e))
+
     def update_trello_board(self):
-        for data_folder in self.data_folders:
-            self._check_running_flowcells(data_folder)
-            self._check_nosync_flowcells(data_folder)
-            # move deleted flowcells to the archive list
-            self._check_archived_flowcells(data_folder)
-
-    def _check_running_flowcells(self, data_folder):
-        # go through subfolders
-        subfolders = filter(os.path.isdir, [os.path.join(data_folder, fc_path) for fc_path in os.listdir(data_folder)])
-        for flowcell_path in subfolders:
+        return self._run_pass()
+
+    def _run_pass(self):
+        started = time.time()
+        self._skipped = []
+        self._reset_board_cache()
+        previous_states, self._flowcell_states = self._flowcell_states, {}
+        self._seen_runs = set()
+        self._checked_keys = set()
+        try:
+            # read the lines added to the transfer log since the previous pass
+            self._run_isolated(self.transfer_log.path, self.transfer_log.update)
+            try:
+                listed = True
+                for data_folder in self.data_folders:
+                    listed = self._check_data_folder(data_folder) and listed
+            except BoardError as e:
+                self._skipped.append((BOARD_KEY, 'pass aborted: {}'.format(e)))
+            else:
+                # forget the runs which are not running any more
+                self.flowcell_table.retain(self._seen_runs)
+                # a run missing from a data folder which could not be listed may still be running
+                if listed:
+                    self.durations.prune(self._seen_runs)
+                    self.transfer_log.prune(self._seen_runs)
+                    self.samplesheets.prune(self._seen_runs)
+                    self.retry_queue.prune(self._checked_keys)
+        except LeaseLost as e:
+            self._skipped.append((LEASE_KEY, 'pass aborted: {}'.format(e)))
+        finally:
+            # another monitor has taken over the board, its state must not be overwritten
+            if not self._lease_lost():
+                self.retry_queue.save()
+                self.durations.save()
+                self.samplesheets.save()
+        self._carry_over_skipped(previous_states, self._flowcell_states)
+        self._pass_metrics = {
+            'pass_started_seconds': started,
+            'pass_duration_seconds': time.time() - started,
+            'skipped_flowcells': len(self.skipped),
+        }
+        return self.skipped
+
+    def _carry_over_skipped(self, previous, current):
+        # keep the last known state of the flowcells skipped in this pass, by flowcell name
+        for key, _ in self.skipped:
+            # an aborted pass has not got to all flowcells, so the served state does not empty during an outage
+            aborted = key in (BOARD_KEY, LEASE_KEY)
+            for name, state in previous.items():
+                if name not in current and (aborted or self._is_under(state.get('path', ''), key)):
+                    current[name] = state
+
+    def _is_under(self, path, key):
+        # the flowcell path is the folder of the key or inside it, /data2/... is not under /data
+        if key.endswith(REFRESH_KEY_SUFFIX):
+            key = key[:-len(REFRESH_KEY_SUFFIX)]
+        key = key.rstrip(os.sep)
+        return path == key or path.startswith(key + os.sep)
+
+    def _record_state(self, state, flowcell_path):
+        state['path'] = flowcell_path
+        self._flowcell_states[state['name']] = state
+
+    def _reset_board_cache(self):
+        # the board may have changed since the previous pass of this monitor
+        self._trello_cards = None
+        self._trello_lists = None
+        self._trello_labels = None
+
+    def _lease_lost(self):
+        return self._lease is not None and self._lease.lost
+
+    def _run_isolated(self, key, func, *args):
+        # stop the pass as soon as the lease is lost instead of racing the monitor which took it over
+        if self._lease_lost():
+            raise LeaseLost('The lease {} has been lost'.format(self._lease.path))
+        self._checked_keys.add(key)
+        # a failing flowcell must not abort the whole pass: record it and retry it later with backoff
+        if self.retry_queue.is_waiting(key):
+            entry = self.retry_queue.entries[key]
+            self._skipped.append((key, 'waiting for retry #{}: {}'.format(entry['attempts'] + 1, entry['error'])))
+            return None
+        try:
+            result = func(*args)
+        except (BoardError, LeaseLost):
+            raise
+        except Exception as e:
+            self.retry_queue.add_failure(key, e)
+            self._skipped.append((key, '{}: {}'.format(e.__class__.__name__, e)))
+            return None
+        self.retry_queue.remove(key)
+        return result
+
+    def _check_data_folder(self, data_folder):
+        # only listing the folder fails for the whole data folder, every flowcell and card is isolated on its own
+        listing = self._run_isolated(data_folder, self._list_data_folder, data_folder)
+        if listing is None:
+            return False
+        flowcell_paths, nosync_paths = listing
+        self._check_running_flowcells(flowcell_paths)
+        self._check_nosync_flowcells(nosync_paths)
+        # move deleted flowcells to the archive list
+        self._check_archived_flowcells(data_folder, nosync_paths)
+        return True
+
+    def _list_data_folder(self, data_folder):
+        # flowcell folders in the data folder and in its nosync folder (None if there is none)
+        with profiling.phase('discovery'):
             # skip non-flowcell folders
-            if not re.match(FC_NAME_RE, os.path.basename(flowcell_path)):
-                continue
-
-            status = FlowcellStatus(flowcell_path)
-            # depending on the type, return instance of related class (hiseq, hiseqx, miseq, etc)
-            flowcell = Flowcell.init_flowcell(status)
-            if flowcell.check_status():
-                # todo: add comment
-                # todo: if comment has been added
-                pass
-            # update flowcell on trello board
+            flowcell_paths = [os.path.join(data_folder, fc_path) for fc_path in os.listdir(data_folder) if re.match(FC_NAME_RE, fc_path)]
+            flowcell_paths = [flowcell_path for flowcell_path in flowcell_paths if os.path.isdir(flowcell_path)]
+            nosync_folder = os.path.join(data_folder, FC_STATUSES['NOSYNC'].lower())
+            nosync_paths = None
+            if os.path.exists(nosync_folder):
+                nosync_paths = [os.path.join(nosync_folder, fc_path) for fc_path in os.listdir(nosync_folder) if re.match(FC_NAME_RE, fc_path)]
+        return flowcell_paths, nosync_paths
+
+    def _check_running_flowcells(self, flowcell_paths):
+        indexes = []
+        for flowcell_path in flowcell_paths:
+            self._seen_runs.add(os.path.basename(flowcell_path))
+            # the card update keeps its backoff while the refresh of the flowcell is failing
+            self._checked_keys.add(flowcell_path)
+            # refreshing the table row has its own retry key, so that a successful refresh does not reset
+            # the backoff of a failing card update
+            index = self._run_isolated(flowcell_path + REFRESH_KEY_SUFFIX, self._refresh_flowcell, flowcell_path)
+            if index is not None:
+                indexes.append(index)
+        with profiling.phase('flowcell_status'):
+            # status, overdue checks and due times of all running flowcells at once
+            self.flowcell_table.evaluate(self.durations)
+        for index in indexes:
+            flowcell = self.flowcell_table.row(index)
+            self._run_isolated(flowcell.path, self._check_running_flowcell, flowcell)
+
+    def _refresh_flowcell(self, flowcell_path):
+        # bring the row of the flowcell in the table up to date, returns its index
+        with profiling.phase('flowcell_status'):
+            table = self.flowcell_table
+            run_id = os.path.basename(flowcell_path)
+            index = table.index(run_id)
+            if index is None:
+                flowcell = self._load_flowcell(flowcell_path)
+                index = table.add(run_id, flowcell_path, flowcell.instrument_type, flowcell.run_mode, flowcell.number_of_cycles)
+            else:
+                table.set_path(index, flowcell_path)
+            table.set_status(index, FlowcellStatus(flowcell_path, transfer_log=self.transfer_log))
+
+            # the cycle times are only read again if their file has changed
+            cycle_times_path = cycle_times_file(flowcell_path)
+            signature = None
+            if cycle_times_path is not None:
+                stat = os.stat(cycle_times_path)
+                signature = (stat.st_mtime, stat.st_size)
+            if signature is None or signature != table.cycles_signature(index):
+                table.set_cycles(index, read_flowcell_cycle_times(flowcell_path), signature)
+        return index
+
+    def _load_flowcell(self, flowcell_path):
+        status = FlowcellStatus(flowcell_path, transfer_log=self.transfer_log)
+        # depending on the type, return instance of related class (hiseq, hiseqx, miseq, etc)
+        return Flowcell.init_flowcell(status, durations=self.durations, server=self.hostname, samplesheets=self.samplesheets)
+
+    def _check_running_flowcell(self, flowcell):
+        # update flowcell on trello board
+        self._update_card(flowcell)
+        self.samplesheets.commit(flowcell.path)
+        self._record_durations(flowcell)
+        self._record_state(flowcell_state(flowcell), flowcell.path)
+
+    def _record_durations(self, flowcell):
+        for kind, duration in flowcell.completed_durations():
+            self.durations.observe(flowcell.full_name, kind, flowcell.instrument_type, flowcell.run_mode, duration)
+
+    def _check_nosync_flowcells(self, nosync_paths):
+        # move flowcell to nosync list
+        for flowcell_path in nosync_paths or []:
+            self._run_isolated(flowcell_path, self._check_nosync_flowcell, flowcell_path)
+
+    def _check_nosync_flowcell(self, flowcell_path):
+        card = self._get_card_by_name(os.path.basename(flowcell_path))
+        # if the card is not on Trello board, create it
+        if card is None:
+            with profiling.phase('flowcell_status'):
+                flowcell = self._load_flowcell(flowcell_path)
             self._update_card(flowcell)
-
-    def _check_nosync_flowcells(self, data_folder):
-        # check nosync folder
-        nosync_folder = os.path.join(data_folder, 'nosync')
-        if os.path.exists(nosync_folder):
-            # move flowcell to nosync list
-            for nosync_flowcell in os.listdir(nosync_folder):
-                flowcell_path = os.path.join(nosync_folder, nosync_flowcell)
-                # skip non-flowcell folders
-                if not re.match(FC_NAME_RE, os.path.basename(flowcell_path)):
-                    continue
-                card = self._get_card_by_name(nosync_flowcell)
-                # if the card is not on Trello board, create it
-                if card is None:
-                    status = FlowcellStatus(flowcell_path)
-                    flowcell = Flowcell.init_flowcell(status)
-                    self._update_card(flowcell)
-                else:
-                    nosync_list = self._get_list_by_name(FC_STATUSES['NOSYNC'])
-                    card.change_list(nosync_list.id)
-
-    def _check_archived_flowcells(self, data_folder):
+            self.samplesheets.commit(flowcell.path)
+            self._record_state(flowcell_state(flowcell), flowcell_path)
+        else:
+            nosync_list = self._get_list_by_name(FC_STATUSES['NOSYNC'])
+            with profiling.phase('trello.change_list'):
+                card.change_list(nosync_list.id)
+            self._record_state({
+                'name': card.name,
+                'server': self.hostname,
+                'trello_list': FC_STATUSES['NOSYNC'],
+                'due_time': None,
+                'warning': None,
+            }, flowcell_path)
+
+    def _check_archived_flowcells(self, data_folder, nosync_paths):
         # if nosync folder exists
-        if os.path.exists(os.path.join(data_folder, FC_STATUSES['NOSYNC']).lower()):
-            # get cards from the nosync list
-            for card in self._get_cards_by_list(FC_STATUSES['NOSYNC']):
-                localhost = socket.gethostname()
-                # if the flowcell belongs to the server
-                if localhost in card.description:
-                    # check if the flowcell has been deleted from the nosync folder
-                    if card.name not in os.listdir(os.path.join(data_folder, FC_STATUSES['NOSYNC'].lower())):
-                        archived_list = self._get_list_by_name(FC_STATUSES['ARCHIVED'])
-                        card.change_list(archived_list.id)
+        if nosync_paths is None:
+            return
+        nosync_flowcells = set(os.path.basename(flowcell_path) for flowcell_path in nosync_paths)
+        nosync_folder = os.path.join(data_folder, FC_STATUSES['NOSYNC'].lower())
+        # get cards from the nosync list
+        for card in self._get_cards_by_list(FC_STATUSES['NOSYNC']):
+            # if the flowcell belongs to the server and has been deleted from the nosync folder
+            if self.hostname in card.description and card.name not in nosync_flowcells:
+                self._run_isolated(os.path.join(nosync_folder, card.name), self._archive_card, card)
+
+    def _archive_card(self, card):
+        archived_list = self._get_list_by_name(FC_STATUSES['ARCHIVED'])
+        with profiling.phase('trello.change_list'):
+            card.change_list(archived_list.id)
 
     def _update_card(self, flowcell):
         # todo: beautify the method
@@ -139,13 +425,20 @@ class FlowcellMonitor(object):
         if trello_card is None:
             return self._create_card(flowcell)
         else:
+            # the description is only rendered again if the sample sheet has changed
+            if flowcell.description_changed:
+                description = flowcell.get_formatted_description()
+                if trello_card.description != description:
+                    with profiling.phase('trello.set_description'):
+                        trello_card.set_description(description)
             # skip aborted list
             if flowcell.trello_list == FC_STATUSES['ABORTED']:
                 return trello_card
             # if card is in the wrong list
             if trello_card.list_id != flowcell_list.id:
                 # move card
-                trello_card.change_list(flowcell_list.id)
+                with profiling.phase('trello.change_list'):
+                    trello_card.change_list(flowcell_list.id)
 
             # if card is in the right list
             else:
@@ -153,9 +446,12 @@ class FlowcellMonitor(object):
                 return trello_card
 
             # update due_time
-            trello_card.set_due(flowcell.due_time)
+            if flowcell.due_time:
+                with profiling.phase('trello.set_due'):
+                    trello_card.set_due(flowcell.due_time)
             if flowcell.trello_list == FC_STATUSES['CHECKSTATUS']:
-                trello_card.comment(flowcell.status.warning)
+                with profiling.phase('trello.comment'):
+                    trello_card.comment(flowcell.warning)
             return trello_card
 
     def _create_card(self, flowcell):
@@ -163,24 +459,35 @@ class FlowcellMonitor(object):
         if not trello_list:
             raise RuntimeError('List {} cannot be found in TrelloBoard {}'.format(flowcell.status, self.trello_board))
 
-        trello_card = trello_list.add_card(name=flowcell.full_name, desc=flowcell.get_formatted_description())
+        description = flowcell.get_formatted_description()
+        with profiling.phase('trello.add_card'):
+            trello_card = trello_list.add_card(name=flowcell.full_name, desc=description)
         if flowcell.trello_list == FC_STATUSES['CHECKSTATUS']:
-            trello_card.comment(flowcell.status.warning)
-        trello_card.set_due(flowcell.due_time)
+            with profiling.phase('trello.comment'):
+                trello_card.comment(flowcell.warning)
+        if flowcell.due_time:
+            with profiling.phase('trello.set_due'):
+                trello_card.set_due(flowcell.due_time)
         self._add_label(trello_card, flowcell)
+        # later lookups in this pass must find the new card
+        self.trello_cards.append(trello_card)
+        return trello_card
 
     def _add_label(self, card, flowcell):
         server = flowcell.server
         label = self._get_label_by_name(server)
         if label is None:
             color = self._get_next_color()
-            label = self.trello_board.add_label(name=server, color=color)
+            board = self.trello_board
+            with profiling.phase('trello.add_label'):
+                label = board.add_label(name=server, color=color)
+            self.trello_labels.append(label)
         if label.id not in [label.id for label in card.labels]:
-            card.add_label(label)
+            with profiling.phase('trello.add_card_label'):
+                card.add_label(label)
 
     def _get_label_by_name(self, name):
-        labels = self.trello_board.get_labels()
-        for label in labels:
+        for label in self.trello_labels:
             if label.name == name:
                 return label
         return None
@@ -211,8 +518,7 @@ class FlowcellMonitor(object):
         return None
 
     def _get_next_color(self):
-        labels = self.trello_board.get_labels()
-        colors = [label.color for label in labels] if labels else []
+        colors = [label.color for label in self.trello_labels]
         # if all colors are used take the first one
         if colors == COLORS:
             return COLORS[0]
@@ -229,6 +535,6 @@ class FlowcellMonitor(object):
             for color in COLORS:
                 color_groups[color] = colors.count(color)
 
-            for color, count in color_groups:
+            for color, count in color_groups.items():
                 if count == min(color_groups.values()):
                     return color
\ No newline at end of file
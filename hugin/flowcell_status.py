@@ -1,6 +1,5 @@
 import os
 import datetime
-import subprocess
 
 from flowcell_parser.classes import CycleTimesParser
 
@@ -16,22 +15,11 @@ FC_STATUSES =  {
 }
 
 
-CYCLE_DURATION = {
-	'RapidRun'          : datetime.timedelta(minutes=12),
-	'HighOutput'        : datetime.timedelta(minutes=100),
-	'RapidHighOutput'   : datetime.timedelta(minutes=43),
-	'MiSeq'             : datetime.timedelta(minutes=6),
-	'HiSeqX'            : datetime.timedelta(minutes=10),
-}
-
-DURATIONS = {
-	'DEMULTIPLEXING'    : datetime.timedelta(hours=4),
-	'TRANSFERING'       : datetime.timedelta(hours=12)
-}
-
 class FlowcellStatus(object):
-	def __init__(self, flowcell_path):
+	def __init__(self, flowcell_path, transfer_log=None):
 		self._path = flowcell_path
+		# hugin.transfer_log.TransferLog, updated once per pass by the monitor
+		self._transfer_log = transfer_log
 
 		# a timestamp when the status has changed
 		self._sequencing_started    = None
@@ -45,7 +33,6 @@ class FlowcellStatus(object):
 		# static values
 		self.demux_file = "./Demultiplexing/Stats/ConversionStats.xml"
 		self.demux_dir = "./Demultiplexing"
-		self.transfering_file = "~.logs/transfer.tsv"
 		self.cycle_times_file = "Logs/CycleTimes.txt"
 
 		self._status = None
@@ -61,9 +48,10 @@ class FlowcellStatus(object):
 			if os.path.basename(os.path.dirname(self.path)) == 'nosync':
 				self._nosync = True
 				self._status = FC_STATUSES['NOSYNC']
-			elif self.transfering_started and not self.transfering_done:
+			# a finished step keeps its status until the next one starts, a run never goes back to sequencing
+			elif self.transfering_started or self.transfering_done:
 				self._status = FC_STATUSES['TRANFERRING']
-			elif self.demultiplexing_started and not self.demultiplexing_done:
+			elif self.demultiplexing_started:
 				self._status = FC_STATUSES['DEMULTIPLEXING']
 			else:
 				self._status = FC_STATUSES['SEQUENCING']
@@ -131,39 +119,25 @@ class FlowcellStatus(object):
 					self._demultiplexing_done = datetime.datetime.fromtimestamp(os.path.getmtime(demux_file))
 		return self._demultiplexing_done
 
+	@property
+	def run_id(self):
+		return os.path.basename(os.path.normpath(self.path))
+
 	@property
 	def transfering_started(self):
 		if self._transfering_started is None:
-			pass
-			# command = "{ls} {path}".format(path=config['transfering']['path'])
-			# proc = subprocess.Popen(['ssh', '-t', '{}@{}' %(config['user'], server_url), command],
-
-			# transfering_file = os.path.join(self.path, self.transfering_file)
-			# if os.path.exists(transfering_file):
-			#     self._transfering_started = datetime.datetime.fromtimestamp(os.path.getctime(transfering_file))
-
+			if self._transfer_log is not None:
+				self._transfering_started = self._transfer_log.started(self.run_id)
 		return self._transfering_started
 
 	@property
 	def transfering_done(self):
 		if self._transfering_done is None:
-			if self.transfering_started:
-				# todo: moved to nosync
-				pass
+			# a line without an event marks a finished transfer even if its start was never logged
+			if self._transfer_log is not None:
+				self._transfering_done = self._transfer_log.done(self.run_id)
 		return self._transfering_done
 
-	@property
-	def demultiplexing_end_time(self):
-		if self.status == FC_STATUSES['DEMULTIPLEXING']:
-			return self.demultiplexing_started + DURATIONS['DEMULTIPLEXING']
-		else: return None
-
-	@property
-	def transferring_end_time(self):
-		if self.status == FC_STATUSES['TRANFERRING']:
-			return self.transfering_started + DURATIONS['TRANSFERING']
-		else: return None
-
 	# def _sequencing_end_time(self):
 	#     if self.cycle_times is None:
 	#         start_time = self.sequencing_started
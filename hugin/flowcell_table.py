@@ -0,0 +1,389 @@
+import datetime
+
+import numpy as np
+
+from hugin.flowcell_status import FC_STATUSES
+from hugin.durations import CYCLE, DEMULTIPLEXING, TRANSFERING
+
+# status codes of the table, FC_STATUSES of the running flowcells
+SEQUENCING_CODE = 0
+DEMULTIPLEXING_CODE = 1
+TRANSFERRING_CODE = 2
+STATUS_CODES = [FC_STATUSES['SEQUENCING'], FC_STATUSES['DEMULTIPLEXING'], FC_STATUSES['TRANFERRING']]
+
+# warning codes and their messages
+NO_WARNING = 0
+WARNINGS = [
+    None,
+    "Cycle {} lasts too long.",
+    'Sequencing lasts too long. Check status',
+    "Demultiplexing takes too long",
+    "Transferring takes too long",
+]
+
+# extra time, in seconds, before a step is taken as too long
+GRACE = 60 * 60
+
+INITIAL_CAPACITY = 64
+
+# name, dtype and empty value of the columns. Timestamps are seconds of local time, NaN if unknown
+COLUMNS = [
+    ('sequencing_started'    , np.float64, np.nan),
+    ('sequencing_done'       , np.float64, np.nan),
+    ('demultiplexing_started', np.float64, np.nan),
+    ('demultiplexing_done'   , np.float64, np.nan),
+    ('transfering_started'   , np.float64, np.nan),
+    ('transfering_done'      , np.float64, np.nan),
+    # cycle times: number of known cycles (-1 if there are none at all), first and last known cycle,
+    # start of the first one, end (or start, if it is running) of the last one and sum of their durations
+    ('known_cycles'          , np.int32  , -1),
+    ('first_cycle_number'    , np.int32  , 0),
+    ('last_cycle_number'     , np.int32  , 0),
+    ('first_cycle_start'     , np.float64, np.nan),
+    ('last_change'           , np.float64, np.nan),
+    ('cycle_time_sum'        , np.float64, 0.0),
+    # mtime and size of the file the cycle times were read from
+    ('cycles_mtime'          , np.float64, np.nan),
+    ('cycles_size'           , np.float64, np.nan),
+    # static values of the run, read once from runParameters.xml and RunInfo.xml
+    ('number_of_cycles'      , np.int32  , 0),
+    ('group'                 , np.int16  , 0),
+    # filled in by evaluate()
+    ('status'                , np.int8   , SEQUENCING_CODE),
+    ('warning'               , np.int8   , NO_WARNING),
+    ('due'                   , np.float64, np.nan),
+    ('progress'              , np.float64, np.nan),
+]
+
+STATUS_TIMES = ['sequencing_started', 'sequencing_done', 'demultiplexing_started', 'demultiplexing_done', 'transfering_started', 'transfering_done']
+
+# naive datetimes are used all over hugin, timestamps are counted from a naive epoch so that they convert back exactly
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_seconds(moment):
+    if moment is None:
+        return np.nan
+    return (moment - EPOCH).total_seconds()
+
+
+def to_datetime(seconds):
+    if np.isnan(seconds):
+        return None
+    return EPOCH + datetime.timedelta(seconds=float(seconds))
+
+
+class FlowcellTable(object):
+    # the running flowcells in one column per value, so that status, overdue checks and due times of all of
+    # them are evaluated at once, and a long-running monitor keeps one row per run instead of rebuilding a
+    # Flowcell and FlowcellStatus for every run and pass. The columns grow by doubling and removed rows are
+    # filled with the last one, so a row index is only valid until the next remove()
+    def __init__(self, server=None, samplesheets=None, load_flowcell=None):
+        self._server = server
+        self._samplesheets = samplesheets
+        # returns the Flowcell of a path, only used to render card descriptions
+        self._load_flowcell = load_flowcell
+        self._size = 0
+        self._capacity = 0
+        self._columns = dict((name, np.empty(0, dtype=dtype)) for name, dtype, _ in COLUMNS)
+        self._run_ids = []
+        self._paths = []
+        # (sample sheet summary, rendered description) of each row, None until a description is asked for
+        self._descriptions = []
+        self._indexes = {}
+        # (instrument type, run mode) of the values in the group column
+        self._groups = []
+        self._evaluated = None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, run_id):
+        return run_id in self._indexes
+
+    @property
+    def server(self):
+        return self._server
+
+    @property
+    def samplesheets(self):
+        return self._samplesheets
+
+    @property
+    def groups(self):
+        return self._groups
+
+    @property
+    def evaluated(self):
+        # the time of the last evaluate(), in seconds
+        return self._evaluated
+
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def index(self, run_id):
+        return self._indexes.get(run_id)
+
+    def run_id(self, index):
+        return self._run_ids[index]
+
+    def path(self, index):
+        return self._paths[index]
+
+    def row(self, index):
+        return FlowcellRow(self, index)
+
+    def rows(self):
+        return [FlowcellRow(self, index) for index in range(self._size)]
+
+    def load_flowcell(self, index):
+        if self._load_flowcell is None:
+            raise RuntimeError('FlowcellTable cannot render descriptions without load_flowcell')
+        return self._load_flowcell(self._paths[index])
+
+    def description(self, index):
+        # the description needs RunInfo.xml, so it is only rendered again when the sample sheet changes
+        summary = self._samplesheets.summary(self._paths[index]) if self._samplesheets is not None else None
+        cached = self._descriptions[index]
+        if cached is None or cached[0] != summary:
+            cached = (summary, self.load_flowcell(index).get_formatted_description())
+            self._descriptions[index] = cached
+        return cached[1]
+
+    def add(self, run_id, path, instrument_type, run_mode, number_of_cycles):
+        if run_id in self._indexes:
+            raise RuntimeError('Run {} is in the flowcell table already'.format(run_id))
+        if self._size == self._capacity:
+            self._grow()
+        index = self._size
+        self._size += 1
+        for name, _, empty in COLUMNS:
+            self._columns[name][index] = empty
+        self._run_ids.append(run_id)
+        self._paths.append(path)
+        self._descriptions.append(None)
+        self._indexes[run_id] = index
+
+        group = (instrument_type, run_mode)
+        if group not in self._groups:
+            self._groups.append(group)
+        self._columns['group'][index] = self._groups.index(group)
+        self._columns['number_of_cycles'][index] = number_of_cycles
+        return index
+
+    def set_path(self, index, path):
+        if path != self._paths[index]:
+            self._paths[index] = path
+            self._descriptions[index] = None
+
+    def remove(self, run_id):
+        index = self._indexes.pop(run_id)
+        last = self._size - 1
+        if index != last:
+            for name, _, _ in COLUMNS:
+                self._columns[name][index] = self._columns[name][last]
+            self._run_ids[index] = self._run_ids[last]
+            self._paths[index] = self._paths[last]
+            self._descriptions[index] = self._descriptions[last]
+            self._indexes[self._run_ids[index]] = index
+        self._run_ids.pop()
+        self._paths.pop()
+        self._descriptions.pop()
+        self._size = last
+
+    def retain(self, run_ids):
+        # forget the runs which are gone, e.g. moved to nosync
+        for run_id in [run_id for run_id in self._run_ids if run_id not in run_ids]:
+            self.remove(run_id)
+
+    def set_status(self, index, status):
+        # timestamps of a hugin.flowcell_status.FlowcellStatus
+        for name in STATUS_TIMES:
+            self._columns[name][index] = to_seconds(getattr(status, name))
+
+    def cycles_signature(self, index):
+        mtime = self._columns['cycles_mtime'][index]
+        if np.isnan(mtime):
+            return None
+        return mtime, self._columns['cycles_size'][index]
+
+    def set_cycles(self, index, cycles, signature=None):
+        # cycles in the format of CycleTimesParser.cycles, None if the run has no cycle times
+        columns = self._columns
+        columns['cycles_mtime'][index], columns['cycles_size'][index] = signature or (np.nan, np.nan)
+        columns['known_cycles'][index] = -1 if cycles is None else len(cycles)
+        if not cycles:
+            columns['first_cycle_number'][index] = 0
+            columns['last_cycle_number'][index] = 0
+            columns['first_cycle_start'][index] = np.nan
+            columns['last_change'][index] = np.nan
+            columns['cycle_time_sum'][index] = 0.0
+            return
+        first_cycle, last_cycle = cycles[0], cycles[-1]
+        columns['first_cycle_number'][index] = first_cycle['cycle_number']
+        columns['last_cycle_number'][index] = last_cycle['cycle_number']
+        columns['first_cycle_start'][index] = to_seconds(first_cycle['start'])
+        # if the last cycle has not finished yet, take its start time
+        columns['last_change'][index] = to_seconds(last_cycle['end'] or last_cycle['start'])
+        columns['cycle_time_sum'][index] = sum((cycle['end'] - cycle['start']).total_seconds() for cycle in cycles if cycle['end'] is not None)
+
+    def evaluate(self, durations, now=None):
+        # status, due time and overdue checks of all rows at once, the same status rule as FlowcellStatus.status
+        now = to_seconds(now or datetime.datetime.now())
+        self._evaluated = now
+        if not self._size:
+            return
+        column = self.column
+        group = column('group')
+        expected_cycle = self._durations(durations.expected, CYCLE)[group]
+        threshold_cycle = self._durations(durations.threshold, CYCLE)[group]
+
+        transfering_done = ~np.isnan(column('transfering_done'))
+        demultiplexing_done = ~np.isnan(column('demultiplexing_done'))
+        # a finished step keeps its status until the next one starts
+        transferring = ~np.isnan(column('transfering_started')) | transfering_done
+        demultiplexing = ~np.isnan(column('demultiplexing_started'))
+        status = np.select([transferring, demultiplexing], [TRANSFERRING_CODE, DEMULTIPLEXING_CODE], SEQUENCING_CODE)
+        sequencing = status == SEQUENCING_CODE
+        demultiplexing = status == DEMULTIPLEXING_CODE
+        transferring = status == TRANSFERRING_CODE
+
+        known_cycles = column('known_cycles')
+        number_of_cycles = column('number_of_cycles')
+        # the measured average needs 10 cycles, before that the expected cycle time is used
+        measured = column('cycle_time_sum') / np.maximum(known_cycles, 1)
+        average = np.where(known_cycles >= 10, measured, expected_cycle)
+        # the cycle times may only have the last cycles, count back to the first one
+        sequencing_end = np.where(
+            known_cycles > 0,
+            column('first_cycle_start') + average * (number_of_cycles - column('first_cycle_number') + 1),
+            column('sequencing_started') + expected_cycle * number_of_cycles,
+        )
+        demultiplexing_end = np.where(demultiplexing_done, column('demultiplexing_done'), column('demultiplexing_started') + self._durations(durations.expected, DEMULTIPLEXING)[group])
+        transferring_end = np.where(transfering_done, column('transfering_done'), column('transfering_started') + self._durations(durations.expected, TRANSFERING)[group])
+        due = np.select([sequencing, demultiplexing, transferring], [sequencing_end, demultiplexing_end, transferring_end], np.nan)
+
+        # a cycle is allowed to take as long as the slowest usual cycle of this instrument
+        slow_cycle = sequencing & (known_cycles > 5) & (now - column('last_change') > np.maximum(average, threshold_cycle) + GRACE)
+        slow_sequencing = sequencing & (known_cycles <= 5) & (now > sequencing_end)
+        slow_demultiplexing = demultiplexing & ~demultiplexing_done & (now > column('demultiplexing_started') + self._durations(durations.threshold, DEMULTIPLEXING)[group] + GRACE)
+        slow_transferring = transferring & ~transfering_done & (now > column('transfering_started') + self._durations(durations.threshold, TRANSFERING)[group] + GRACE)
+
+        progress = np.where(known_cycles > 0, np.clip(column('last_cycle_number') / np.maximum(number_of_cycles, 1).astype(np.float64), 0, 1), np.nan)
+        column('status')[:] = status
+        column('warning')[:] = np.select([slow_cycle, slow_sequencing, slow_demultiplexing, slow_transferring], [1, 2, 3, 4], NO_WARNING)
+        column('due')[:] = due
+        column('progress')[:] = np.where(sequencing, progress, 1.0)
+
+    def overdue(self):
+        # indexes of the rows flagged by the last evaluate()
+        return np.flatnonzero(self.column('warning') != NO_WARNING)
+
+    def _durations(self, get_duration, kind):
+        # one value per (instrument type, run mode), in seconds
+        return np.array([get_duration(kind, instrument_type, run_mode).total_seconds() for instrument_type, run_mode in self._groups])
+
+    def _grow(self):
+        capacity = max(INITIAL_CAPACITY, 2 * self._capacity)
+        for name, dtype, empty in COLUMNS:
+            column = np.full(capacity, empty, dtype=dtype)
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+        self._capacity = capacity
+
+
+class FlowcellRow(object):
+    # a view of one row of a FlowcellTable, usable wherever the monitor takes a Flowcell
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def _value(self, name):
+        return self._table.column(name)[self._index]
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def full_name(self):
+        return self._table.run_id(self._index)
+
+    @property
+    def path(self):
+        return self._table.path(self._index)
+
+    @property
+    def server(self):
+        return self._table.server
+
+    @property
+    def instrument_type(self):
+        return self._table.groups[self._value('group')][0]
+
+    @property
+    def run_mode(self):
+        return self._table.groups[self._value('group')][1]
+
+    @property
+    def number_of_cycles(self):
+        return int(self._value('number_of_cycles'))
+
+    @property
+    def status(self):
+        return STATUS_CODES[self._value('status')]
+
+    @property
+    def check_status(self):
+        return self._value('warning') != NO_WARNING
+
+    @property
+    def trello_list(self):
+        if self.check_status:
+            return FC_STATUSES['CHECKSTATUS']
+        return self.status
+
+    @property
+    def warning(self):
+        warning = WARNINGS[self._value('warning')]
+        if warning is None:
+            return None
+        return warning.format(self._value('last_cycle_number'))
+
+    @property
+    def due_time(self):
+        return to_datetime(self._value('due'))
+
+    @property
+    def eta(self):
+        # time left until the due time, at the last evaluate()
+        due = self._value('due')
+        if np.isnan(due):
+            return None
+        return datetime.timedelta(seconds=float(due - self._table.evaluated))
+
+    @property
+    def progress(self):
+        progress = self._value('progress')
+        return None if np.isnan(progress) else float(progress)
+
+    @property
+    def description_changed(self):
+        samplesheets = self._table.samplesheets
+        return samplesheets is not None and samplesheets.summary(self.path) is not None and samplesheets.changed(self.path)
+
+    def get_formatted_description(self):
+        return self._table.description(self._index)
+
+    def completed_durations(self):
+        # durations of the steps this run has finished, to be added to the duration tables
+        durations = []
+        known_cycles = self._value('known_cycles')
+        if not np.isnan(self._value('sequencing_done')) and known_cycles >= 10:
+            durations.append((CYCLE, self._value('cycle_time_sum') / known_cycles))
+        for kind, started, done in ((DEMULTIPLEXING, 'demultiplexing_started', 'demultiplexing_done'), (TRANSFERING, 'transfering_started', 'transfering_done')):
+            durations.append((kind, self._value(done) - self._value(started)))
+        # NaN if a step is not done, and timestamps taken from ctime/mtime can be out of order
+        return [(kind, datetime.timedelta(seconds=float(duration))) for kind, duration in durations if duration > 0]
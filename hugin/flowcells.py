@@ -1,32 +1,55 @@
 import os
 import socket
-import datetime
 
 from flowcell_parser.classes import RunParametersParser, RunInfoParser, CycleTimesParser
 
 from hugin.flowcell_status import FC_STATUSES
+from hugin.durations import DurationTable
+from hugin.flowcell_table import FlowcellTable, STATUS_CODES
+from hugin.interop import read_cycle_times, EXTRACTION_METRICS_FILE
+from hugin.samplesheet import SampleSheetCache, format_summary
+from hugin import profiling
 
-CYCLE_DURATION = {
-    'RapidRun'          : datetime.timedelta(minutes=12),
-    'HighOutput'        : datetime.timedelta(minutes=100),
-    'RapidHighOutput'   : datetime.timedelta(minutes=43),
-    'MiSeq'             : datetime.timedelta(minutes=6),
-    'HiSeqX'            : datetime.timedelta(minutes=10),
-}
+CYCLE_TIMES_FILE = 'Logs/CycleTimes.txt'
+
+
+def cycle_times_file(flowcell_path):
+    # the file the cycle times of a run are read from, None if there is none yet
+    for name in (CYCLE_TIMES_FILE, EXTRACTION_METRICS_FILE):
+        path = os.path.join(flowcell_path, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_flowcell_cycle_times(flowcell_path):
+    cycle_times_path = os.path.join(flowcell_path, CYCLE_TIMES_FILE)
+    with profiling.phase('cycle_times'):
+        if os.path.exists(cycle_times_path):
+            # todo: CycleTimesParser fails when no file found
+            return CycleTimesParser(cycle_times_path).cycles
+        # e.g. MiSeq and HiSeq 2500 do not write CycleTimes.txt, read the progress from InterOp
+        return read_cycle_times(flowcell_path)
 
-DURATIONS = {
-    'DEMULTIPLEXING'    : datetime.timedelta(hours=4),
-    'TRANSFERING'       : datetime.timedelta(hours=12)
-}
 
 class Flowcell(object):
-    def __init__(self, status):
+    # key of the instrument in the duration tables, set in subclasses
+    instrument_type = None
+
+    def __init__(self, status, durations=None, server=None, samplesheets=None):
         self._status = status
+        # learned durations, falls back to the priors if not given
+        self._durations = durations or DurationTable()
+        # name of the preprocessing server, several agents may run on one machine
+        self._server = server
+        # cached sample sheet summaries, SampleSheet.csv is read on every call if not given
+        self._samplesheets = samplesheets or SampleSheetCache()
 
         self._id = None
         self._run_parameters = None
         self._run_info = None
         self._cycle_times = None
+        self._row = None
 
     @property
     def path(self):
@@ -36,9 +59,25 @@ class Flowcell(object):
     def status(self):
         return self._status
 
+    @property
+    def durations(self):
+        return self._durations
+
+    @property
+    def run_mode(self):
+        return self.run_parameters.get('RunMode')
+
+    @property
+    def warning(self):
+        if self.status.status in STATUS_CODES:
+            return self.row.warning
+        return self.status.warning
+
     @property
     def trello_list(self):
-        if self.status.check_status:
+        if self.status.status in STATUS_CODES:
+            return self.row.trello_list
+        elif self.status.check_status:
             return FC_STATUSES['CHECKSTATUS']
         else: return self.status.status
 
@@ -49,7 +88,8 @@ class Flowcell(object):
             if not os.path.exists(run_info_path):
                 raise RuntimeError('RunInfo.xml cannot be found in {}'.format(self.path))
 
-            self._run_info = RunInfoParser(run_info_path).data
+            with profiling.phase('xml_parsing'):
+                self._run_info = RunInfoParser(run_info_path).data
         return self._run_info
 
     @property
@@ -58,44 +98,39 @@ class Flowcell(object):
             run_parameters_path = os.path.join(self.path, 'runParameters.xml')
             if not os.path.exists(run_parameters_path):
                 raise RuntimeError('runParameters.xml cannot be found in {}'.format(self.path))
-            self._run_parameters = RunParametersParser(run_parameters_path).data['RunParameters']
+            with profiling.phase('xml_parsing'):
+                self._run_parameters = RunParametersParser(run_parameters_path).data['RunParameters']
         return  self._run_parameters
 
-    @property
-    def name(self):
-        raise NotImplementedError("@property 'name' must be implemented in subclass {}".format(self.__class__.__name__))
-
     @classmethod
-    def init_flowcell(cls, status):
+    def init_flowcell(cls, status, durations=None, server=None, samplesheets=None):
         flowcell_dir = status.path
         try:
-            parser = RunParametersParser(os.path.join(flowcell_dir, 'runParameters.xml'))
+            with profiling.phase('xml_parsing'):
+                parser = RunParametersParser(os.path.join(flowcell_dir, 'runParameters.xml'))
             # print rp.data
 
         except OSError:
             raise RuntimeError("Cannot find the runParameters.xml file at {}. This is quite unexpected.".format(flowcell_dir))
         else:
+            # MiSeq runParameters.xml has no Setup section
+            setup = parser.data['RunParameters'].get('Setup', parser.data['RunParameters'])
             try:
-                runtype = parser.data['RunParameters']["Setup"]["Flowcell"]
+                runtype = setup["Flowcell"]
             except KeyError:
                 # logger.warn("Parsing runParameters to fecth instrument type, not found Flowcell information in it. Using ApplicaiotnName")
-                runtype = parser.data['RunParameters']['Setup'].get("ApplicationName", '')
+                runtype = setup.get("ApplicationName", '')
 
             # depending on the type of flowcell, return instance of related class
             if "HiSeq X" in runtype:
-                return HiseqXFlowcell(status)
+                return HiseqXFlowcell(status, durations=durations, server=server, samplesheets=samplesheets)
             elif "MiSeq" in runtype:
-                return MiseqRun(status)
+                return MiseqFlowcell(status, durations=durations, server=server, samplesheets=samplesheets)
             elif "HiSeq" in runtype or "TruSeq" in runtype:
-                return HiseqRun(status)
+                return HiseqFlowcell(status, durations=durations, server=server, samplesheets=samplesheets)
             else:
                 raise RuntimeError("Unrecognized runtype {} of run {}. Someone as likely bought a new sequencer without telling it to the bioinfo team".format(runtype, flowcell_dir))
 
-
-class HiseqXFlowcell(Flowcell):
-    def __init__(self, status):
-        super(HiseqXFlowcell, self).__init__(status)
-
     @property
     def full_name(self):
         return os.path.basename(self.status.path)
@@ -103,10 +138,7 @@ class HiseqXFlowcell(Flowcell):
     @property
     def cycle_times(self):
         if self._cycle_times is None:
-            cycle_times_path = os.path.join(self.path, 'Logs/CycleTimes.txt')
-            if os.path.exists(cycle_times_path):
-                # todo: CycleTimesParser fails when no file found
-                self._cycle_times = CycleTimesParser(cycle_times_path).cycles
+            self._cycle_times = read_flowcell_cycle_times(self.path)
         return self._cycle_times
 
     @property
@@ -147,40 +179,16 @@ class HiseqXFlowcell(Flowcell):
 
     @property
     def chemistry(self):
-        return self.run_parameters['ChemistryVersion']
+        return self.run_parameters.get('ChemistryVersion') or self.run_parameters.get('Chemistry', '')
 
     @property
-    def run_parameters(self):
-        # dangerous
-        # call run_parameters from the base class
-        return Flowcell.run_parameters.fget(self)['Setup']
-    #
-    @property
-    def average_cycle_time(self):
-        if self.cycle_times:
-            sum_duration = datetime.timedelta(0)
-            for cycle in self.cycle_times:
-                duration = cycle['end'] - cycle['start']
-                sum_duration += duration
-
-            if len(self.cycle_times) < 10:
-                # todo: depending on RunMode
-                average_duration = CYCLE_DURATION['HiSeqX']
-            else:
-                average_duration = sum_duration / len(self.cycle_times)
-            return average_duration
-        return None
+    def samplesheet_summary(self):
+        return self._samplesheets.summary(self.path)
 
     @property
-    def due_time(self):
-        if self.status.status == FC_STATUSES['SEQUENCING']:
-            return self._sequencing_end_time()
-        elif self.status.status == FC_STATUSES['DEMULTIPLEXING']:
-            return self.status.demultiplexing_end_time
-        elif self.status.status == FC_STATUSES['TRANFERRING']:
-            return self.status.transfering_end_time
-        else:
-            raise NotImplementedError('Unknown status: {}. End time for the status not implemented'.format(self.status.status))
+    def description_changed(self):
+        # the description only changes with the sample sheet, everything else comes from RunInfo.xml
+        return self.samplesheet_summary is not None and self._samplesheets.changed(self.path)
 
     @property
     def number_of_cycles(self):
@@ -191,64 +199,39 @@ class HiseqXFlowcell(Flowcell):
 
     @property
     def server(self):
-        return socket.gethostname()
-
-
-    def check_status(self):
-        if self.status.status == FC_STATUSES['SEQUENCING']:
-            return self._check_sequencing()
-        elif self.status.status == FC_STATUSES['DEMULTIPLEXING']:
-            return self._check_demultiplexing()
-        elif self.status.status == FC_STATUSES['TRANFERRING']:
-            return self._check_transferring()
-
-    def _check_demultiplexing(self):
-        if self.status.status == FC_STATUSES['DEMULTIPLEXING']:
-            current_time = datetime.datetime.now()
-            if self.status.demultiplexing_end_time > current_time + datetime.timedelta(hours=1):
-                self.status.warning = "Demultiplexing takes too long"
-                self.status.check_status = True
-        return self.status.check_status
-
-    def _check_transferring(self):
-        if self.status.status == FC_STATUSES['TRANFERRING']:
-            current_time = datetime.datetime.now()
-            if self.status.transfering_end_time > current_time + datetime.timedelta(hours=1):
-                self.status.warning = "Transferring takes too long"
-                self.status.check_status = True
-        return self.status.check_status
+        return self._server or socket.gethostname()
 
-    def _check_sequencing(self):
-        if self.status.status == FC_STATUSES['SEQUENCING']:
-            current_time = datetime.datetime.now()
-            if self.cycle_times and len(self.cycle_times) > 5:
-                average_duration = self.average_cycle_time
-                last_cycle = self.cycle_times[-1]
-                last_change = last_cycle['end'] or last_cycle['start']  # if cycle has not finished yet, take start time
+    @property
+    def row(self):
+        # status, due time and overdue checks of a running flowcell, evaluated by a FlowcellTable of its own
+        # so that the rules exist once, for the monitor and for single flowcells alike
+        if self._row is None:
+            table = FlowcellTable(server=self.server)
+            index = table.add(self.full_name, self.path, self.instrument_type, self.run_mode, self.number_of_cycles)
+            table.set_status(index, self.status)
+            table.set_cycles(index, self.cycle_times)
+            table.evaluate(self.durations)
+            self._row = table.row(index)
+        return self._row
 
-                current_duration = current_time - last_change
+    @property
+    def due_time(self):
+        if self.status.status in STATUS_CODES:
+            return self.row.due_time
+        elif self.status.status == FC_STATUSES['NOSYNC']:
+            # nothing left to wait for
+            return None
+        else:
+            raise NotImplementedError('Unknown status: {}. End time for the status not implemented'.format(self.status.status))
 
-                if current_duration > average_duration + datetime.timedelta(hours=1):
-                    self.status.warning = "Cycle {} lasts too long.".format(last_cycle['cycle_number'])
-                    self.status.check_status = True
-            else:
-                if current_time > self._sequencing_end_time():
-                    self.status.warning = 'Sequencing lasts too long. Check status'
-                    self.status.check_status = True
+    def check_status(self):
+        if self.status.status in STATUS_CODES:
+            return self.row.check_status
         return self.status.check_status
 
-    def _sequencing_end_time(self):
-        if self.cycle_times is None:
-            start_time = self.status.sequencing_started
-            # todo duration depending on the run mode!
-            duration = CYCLE_DURATION['HiSeqX'] * self.number_of_cycles
-            end_time = start_time + duration
-        else:
-            duration = self.average_cycle_time * self.number_of_cycles
-            start_time = self.cycle_times[0]['start']
-            end_time = start_time + duration
-        return end_time
-
+    def completed_durations(self):
+        # durations of the steps this run has finished, to be added to the duration tables
+        return self.row.completed_durations()
 
     def get_formatted_description(self):
         description = """
@@ -260,23 +243,58 @@ class HiseqXFlowcell(Flowcell):
     Tiles: {tiles}
     Reads: {reads}
     Index: {index}
-    Chemistry: {chemistry}
+    Chemistry: {chemistry}{samplesheet}
         """.format(
                 date=self.run_info['Date'],
                 flowcell=self.run_info['Flowcell'],
                 instrument=self.run_info['Instrument'],
-                localhost=socket.gethostname(),
+                localhost=self.server,
                 lanes=self.run_info['FlowcellLayout']['LaneCount'],
                 tiles=self.run_info['FlowcellLayout']['TileCount'],
                 reads=self.formatted_reads,
                 index=self.formatted_index,
                 chemistry=self.chemistry,
+                samplesheet="".join("\n    {}".format(line) for line in format_summary(self.samplesheet_summary or [])),
         )
         return description
 
-class MiSeq(Flowcell):
-    pass
 
+class HiseqXFlowcell(Flowcell):
+    instrument_type = 'HiSeqX'
+
+    def __init__(self, status, durations=None, server=None, samplesheets=None):
+        super(HiseqXFlowcell, self).__init__(status, durations=durations, server=server, samplesheets=samplesheets)
+
+    @property
+    def run_parameters(self):
+        # dangerous
+        # call run_parameters from the base class
+        return Flowcell.run_parameters.fget(self)['Setup']
+
+    @property
+    def run_mode(self):
+        # HiSeq X has one run mode only
+        return None
+
+
+class MiseqFlowcell(Flowcell):
+    instrument_type = 'MiSeq'
+
+    def __init__(self, status, durations=None, server=None, samplesheets=None):
+        super(MiseqFlowcell, self).__init__(status, durations=durations, server=server, samplesheets=samplesheets)
 
-class HiSeq(Flowcell):
-    pass
\ No newline at end of file
+    @property
+    def run_mode(self):
+        # MiSeq has one run mode only
+        return None
+
+
+class HiseqFlowcell(Flowcell):
+    instrument_type = 'HiSeq'
+
+    def __init__(self, status, durations=None, server=None, samplesheets=None):
+        super(HiseqFlowcell, self).__init__(status, durations=durations, server=server, samplesheets=samplesheets)
+
+    @property
+    def run_parameters(self):
+        return Flowcell.run_parameters.fget(self)['Setup']
\ No newline at end of file
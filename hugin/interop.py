@@ -0,0 +1,101 @@
+import os
+import mmap
+import struct
+import datetime
+
+import numpy as np
+
+EXTRACTION_METRICS_FILE = 'InterOp/ExtractionMetricsOut.bin'
+
+# number of records read from the end of the file, should cover at least 10 cycles of all tiles
+DEFAULT_TAIL_RECORDS = 64 * 1024
+
+# ExtractionMetricsOut.bin version 2: one record per tile and cycle, written when the images of the tile are extracted
+EXTRACTION_DTYPES = {
+    2: np.dtype([
+        ('lane', '<u2'),
+        ('tile', '<u2'),
+        ('cycle', '<u2'),
+        ('fwhm', '<f4', (4,)),
+        ('intensity', '<u2', (4,)),
+        ('date_time', '<u8'),
+    ]),
+}
+
+# timestamps are C# DateTime.ToBinary() values: 62 bits of 100ns ticks since 0001-01-01 and 2 bits of kind
+TICKS_MASK = 0x3FFFFFFFFFFFFFFF
+TICKS_CEILING = 0x4000000000000000
+TICKS_1970 = 621355968000000000
+TICKS_PER_SECOND = 10 ** 7
+
+
+def _to_unix_time(date_time):
+    ticks = (date_time & np.uint64(TICKS_MASK)).astype(np.int64)
+    # local times are stored as utc ticks, which can wrap around the ceiling
+    ticks = np.where(ticks > TICKS_CEILING - TICKS_1970, ticks - TICKS_CEILING, ticks)
+    ticks = np.where(ticks < 0, ticks + TICKS_CEILING, ticks)
+    return (ticks - TICKS_1970) / float(TICKS_PER_SECOND)
+
+
+def read_extraction_tail(path, tail_records=DEFAULT_TAIL_RECORDS):
+    # returns the last tail_records records of an ExtractionMetricsOut.bin file, None if it cannot be read
+    with open(path, 'rb') as metrics_file:
+        size = os.fstat(metrics_file.fileno()).st_size
+        if size < 2:
+            return None
+        version, record_size = struct.unpack('<BB', metrics_file.read(2))
+        dtype = EXTRACTION_DTYPES.get(version)
+        if dtype is None or dtype.itemsize != record_size:
+            return None
+        count = (size - 2) // record_size
+        if count == 0:
+            return None
+        first = max(0, count - tail_records)
+
+        # map the file, so that only the pages of the tail are read from disk
+        metrics_map = mmap.mmap(metrics_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = np.frombuffer(metrics_map, dtype=dtype, count=count - first, offset=2 + first * record_size)
+            records = view.copy()
+            # the map cannot be closed while a view is exported
+            del view
+        finally:
+            metrics_map.close()
+    return records
+
+
+def read_cycle_times(flowcell_path, tail_records=DEFAULT_TAIL_RECORDS):
+    # cycle times in the format of CycleTimesParser.cycles: a list of {'cycle_number', 'start', 'end'}
+    # for the completed cycles at the end of the InterOp file
+    path = os.path.join(flowcell_path, EXTRACTION_METRICS_FILE)
+    if not os.path.exists(path):
+        return None
+    records = read_extraction_tail(path, tail_records)
+    if records is None:
+        return None
+
+    order = np.argsort(records['cycle'], kind='mergesort')
+    cycles = records['cycle'][order]
+    times = _to_unix_time(records['date_time'][order])
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(cycles)) + 1))
+    cycle_numbers = cycles[starts]
+    tile_counts = np.diff(np.concatenate((starts, [len(cycles)])))
+    last_extracted = np.maximum.reduceat(times, starts)
+
+    # the first cycle in the tail may be cut, the last ones may still be extracted
+    if len(records) == tail_records and len(cycle_numbers) > 1:
+        cycle_numbers, tile_counts, last_extracted = cycle_numbers[1:], tile_counts[1:], last_extracted[1:]
+    completed = np.flatnonzero(tile_counts >= tile_counts.max())
+    if len(completed) == 0:
+        return None
+    last_completed = completed[-1]
+
+    cycle_times = []
+    # a cycle starts when the previous one has been extracted, so the first cycle only marks the start of the second
+    for i in range(1, last_completed + 1):
+        cycle_times.append({
+            'cycle_number': int(cycle_numbers[i]),
+            'start': datetime.datetime.fromtimestamp(last_extracted[i - 1]),
+            'end': datetime.datetime.fromtimestamp(last_extracted[i]),
+        })
+    return cycle_times or None
@@ -0,0 +1,13 @@
+import os
+import json
+
+
+def write_json(path, data, **kwargs):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    # write to a temporary file first, so that a crash or a concurrent reader never sees a half-written file
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, **kwargs)
+    os.rename(tmp_path, path)
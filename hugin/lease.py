@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+# a lease which has not been renewed for this many seconds is considered stale and can be taken over
+DEFAULT_TTL = 10 * 60
+
+
+class LeaseLost(RuntimeError):
+    # the lease has been taken over while the work it protects was still running
+    pass
+
+
+class Lease(object):
+    def __init__(self, path, ttl=DEFAULT_TTL, heartbeat_interval=None):
+        self._path = path
+        self._ttl = ttl
+        self._heartbeat_interval = heartbeat_interval or ttl / 3.0
+        self._token = uuid.uuid4().hex
+        self._held = False
+        self._lost = False
+        self._watch = False
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def followup_path(self):
+        return '{}.followup'.format(self.path)
+
+    @property
+    def held(self):
+        return self._held and not self._lost
+
+    @property
+    def lost(self):
+        return self._lost
+
+    @property
+    def owner(self):
+        return self._read_owner(self.path)
+
+    def acquire(self, watch=False):
+        # a monitor in watch mode starts its passes by itself and never takes a follow-up
+        self._watch = watch
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        if not self._create() and not (self._is_stale() and self._take_over() and self._create()):
+            return False
+
+        self._held = True
+        self._lost = False
+        # the first pass covers whatever a follow-up left behind by the previous holder asked for
+        self.take_followup()
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='hugin-lease-heartbeat')
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+        return True
+
+    def release(self):
+        if not self._held:
+            return
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        # do not remove a lease which has been taken over by somebody else
+        if self._owns_lease():
+            os.remove(self.path)
+        self._held = False
+
+    def request_followup(self):
+        if (self.owner or {}).get('watch'):
+            return False
+        # at most one follow-up run is queued, no matter how many runs are waiting for the lease
+        try:
+            os.close(os.open(self.followup_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return False
+        return True
+
+    def take_followup(self):
+        try:
+            os.remove(self.followup_path)
+        except OSError:
+            return False
+        return True
+
+    def _create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+        owner = {
+            'token': self._token,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'acquired': time.time(),
+            'watch': self._watch,
+        }
+        with os.fdopen(fd, 'w') as lease_file:
+            json.dump(owner, lease_file)
+        return True
+
+    def _read_owner(self, path):
+        try:
+            with open(path) as lease_file:
+                return json.load(lease_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _is_stale(self, path=None):
+        try:
+            heartbeat = os.path.getmtime(path or self.path)
+        except OSError:
+            # the lease has been released in the meantime
+            return True
+        return time.time() - heartbeat > self._ttl
+
+    def _take_over(self):
+        stale_owner = (self.owner or {}).get('token')
+        # renaming is atomic, so only one of several competing processes can move the stale lease away
+        stale_path = '{}.stale.{}'.format(self.path, self._token)
+        try:
+            os.rename(self.path, stale_path)
+        except OSError:
+            return not os.path.exists(self.path)
+        # the lease may have been renewed or replaced by a new owner since it was found stale
+        renamed_owner = (self._read_owner(stale_path) or {}).get('token')
+        if renamed_owner != stale_owner or not self._is_stale(stale_path):
+            try:
+                # unlike rename, link does not replace a lease created in the meantime
+                os.link(stale_path, self.path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        return True
+
+    def _owns_lease(self):
+        owner = self.owner
+        return owner is not None and owner.get('token') == self._token
+
+    def _heartbeat(self):
+        while not self._stop.wait(self._heartbeat_interval):
+            if not self._owns_lease():
+                self._lost = True
+                return
+            try:
+                os.utime(self.path, None)
+            except OSError:
+                self._lost = True
+                return
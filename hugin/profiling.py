@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import pstats
+import socket
+import cProfile
+import threading
+
+# io.StringIO exists on python 2 as well, but only accepts unicode, which pstats does not write there
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+PROFILERS = ['cprofile', 'sample']
+DEFAULT_TOP = 20
+# seconds between two stack samples
+DEFAULT_INTERVAL = 0.005
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullProfiler(object):
+    # used when profiling is off: a phase is one function call returning a shared no-op context manager
+    def phase(self, name):
+        return _NULL_PHASE
+
+
+_profiler = NullProfiler()
+
+
+def phase(name):
+    # with phase('discovery'): ... attributes the time spent in the block to the phase, if a profiler is installed
+    return _profiler.phase(name)
+
+
+def install(profiler):
+    global _profiler
+    _profiler = profiler
+    return profiler
+
+
+def uninstall():
+    install(NullProfiler())
+
+
+def output_prefix(directory):
+    return os.path.join(directory, '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), socket.gethostname()))
+
+
+class _Phase(object):
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.enter(self._name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.exit()
+        return False
+
+
+class _PhaseProfiler(object):
+    # keeps the stack of nested phases of the thread the profiler was created in, other threads are not profiled
+    def __init__(self):
+        self._thread = threading.current_thread()
+        self._stack = []
+
+    @property
+    def current_phase(self):
+        # may be read from another thread while the stack changes
+        try:
+            return self._stack[-1]
+        except IndexError:
+            return None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def phase(self, name):
+        if threading.current_thread() is not self._thread:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def enter(self, name):
+        self._stack.append(name)
+
+    def exit(self):
+        self._stack.pop()
+
+
+class CProfiler(_PhaseProfiler):
+    # one cProfile.Profile per phase. Only the innermost phase is enabled, so a nested phase (e.g. a Trello call
+    # while checking a flowcell) is not counted in the outer one
+    def __init__(self):
+        super(CProfiler, self).__init__()
+        self._profiles = {}
+
+    def enter(self, name):
+        if self._stack:
+            self._profiles[self._stack[-1]].disable()
+        super(CProfiler, self).enter(name)
+        self._profiles.setdefault(name, cProfile.Profile()).enable()
+
+    def exit(self):
+        self._profiles[self._stack[-1]].disable()
+        super(CProfiler, self).exit()
+        if self._stack:
+            self._profiles[self._stack[-1]].enable()
+
+    def write(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        prefix = output_prefix(directory)
+        paths = []
+        for name, profile in sorted(self._profiles.items()):
+            path = '{}-{}.pstats'.format(prefix, name)
+            profile.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def summary(self, top=DEFAULT_TOP):
+        output = StringIO()
+        for name, profile in sorted(self._profiles.items()):
+            output.write('=== {} ===\n'.format(name))
+            stats = pstats.Stats(profile, stream=output)
+            stats.sort_stats('tottime').print_stats(top)
+        return output.getvalue()
+
+
+class SamplingProfiler(_PhaseProfiler):
+    # samples the stack of the profiled thread every interval seconds from a background thread. Much cheaper
+    # than cProfile for long passes, but only statistically accurate
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        super(SamplingProfiler, self).__init__()
+        self._interval = interval
+        # phase -> collapsed stack -> number of samples
+        self._samples = {}
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name='hugin-profiler')
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        ident = self._thread.ident
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}:{}'.format(os.path.basename(code.co_filename), code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            samples = self._samples.setdefault(self.current_phase or 'other', {})
+            key = ';'.join(reversed(stack))
+            samples[key] = samples.get(key, 0) + 1
+
+    def write(self, directory):
+        # one file per phase in the collapsed format of flamegraph.pl
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        prefix = output_prefix(directory)
+        paths = []
+        for name, samples in sorted(self._samples.items()):
+            path = '{}-{}.folded'.format(prefix, name)
+            with open(path, 'w') as samples_file:
+                for stack, count in sorted(samples.items()):
+                    samples_file.write('{} {}\n'.format(stack, count))
+            paths.append(path)
+        return paths
+
+    def summary(self, top=DEFAULT_TOP):
+        output = StringIO()
+        for name, samples in sorted(self._samples.items()):
+            total = sum(samples.values())
+            # samples in which the function itself was running
+            functions = {}
+            for stack, count in samples.items():
+                function = stack.rsplit(';', 1)[-1]
+                functions[function] = functions.get(function, 0) + count
+            output.write('=== {} ({} samples, {:.2f}s) ===\n'.format(name, total, total * self._interval))
+            for function, count in sorted(functions.items(), key=lambda item: -item[1])[:top]:
+                output.write('{:6.1f}% {}\n'.format(100.0 * count / total, function))
+        return output.getvalue()
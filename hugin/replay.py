@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import shutil
+import datetime
+
+from flowcell_parser.classes import CycleTimesParser
+
+from hugin.flowcell_monitor import FlowcellMonitor
+from hugin.flowcell_status import FC_STATUSES
+from hugin.fake_trello import FakeBoard
+from hugin.transfer_log import TRANSFER_STARTED, TRANSFER_DONE
+
+# events of a timeline, e.g. {'time': 600, 'run': '150424_ST-E00214_0031_BH2WY7CCXX', 'event': 'cycle', 'cycle': 1}.
+# time is in seconds from the start of the timeline
+CREATE = 'create'
+CYCLE = 'cycle'
+RTA_COMPLETE = 'rta_complete'
+DEMULTIPLEXING = 'demultiplexing'
+DEMULTIPLEXING_DONE = 'demultiplexing_done'
+TRANSFER_START = 'transfer_started'
+TRANSFER_END = 'transfer_done'
+NOSYNC = 'nosync'
+DELETE = 'delete'
+EVENTS = [CREATE, CYCLE, RTA_COMPLETE, DEMULTIPLEXING, DEMULTIPLEXING_DONE, TRANSFER_START, TRANSFER_END, NOSYNC, DELETE]
+
+# the list a card should be in after an event, the end of a step keeps the card in the list of the step.
+# Other events are played, but not waited for on the board. An event can ask for another list with an 'expect' key
+EXPECTED_LISTS = {
+    CREATE             : FC_STATUSES['SEQUENCING'],
+    DEMULTIPLEXING     : FC_STATUSES['DEMULTIPLEXING'],
+    DEMULTIPLEXING_DONE: FC_STATUSES['DEMULTIPLEXING'],
+    TRANSFER_START     : FC_STATUSES['TRANFERRING'],
+    TRANSFER_END       : FC_STATUSES['TRANFERRING'],
+    NOSYNC             : FC_STATUSES['NOSYNC'],
+    DELETE             : FC_STATUSES['ARCHIVED'],
+}
+
+# the order in which a card goes through the lists. Check status and Aborted are not part of it,
+# a card can come back from there to the list of its step
+LIST_ORDER = [
+    FC_STATUSES['SEQUENCING'],
+    FC_STATUSES['DEMULTIPLEXING'],
+    FC_STATUSES['TRANFERRING'],
+    FC_STATUSES['NOSYNC'],
+    FC_STATUSES['ARCHIVED'],
+]
+
+# files of the template run folder copied when a run is created
+TEMPLATE_FILES = ['RunInfo.xml', 'runParameters.xml', 'SampleSheet.csv']
+
+# seconds between the end of the last cycle and the following events of a synthetic run
+SYNTHETIC_STEPS = [
+    (RTA_COMPLETE       , 60),
+    (DEMULTIPLEXING     , 10 * 60),
+    (DEMULTIPLEXING_DONE, 4 * 60 * 60),
+    (TRANSFER_START     , 10 * 60),
+    (TRANSFER_END       , 2 * 60 * 60),
+    (NOSYNC             , 60 * 60),
+    (DELETE             , 24 * 60 * 60),
+]
+
+CRON = 'cron'
+WATCH = 'watch'
+MODES = [CRON, WATCH]
+
+# monitor interval in timeline seconds, as in a */5 crontab entry
+DEFAULT_INTERVAL = 5 * 60
+DEFAULT_SPEED = 600
+
+
+def synthetic_timeline(run_id, cycles=20, cycle_duration=10 * 60, start=0, steps=SYNTHETIC_STEPS):
+    events = [{'time': start, 'run': run_id, 'event': CREATE}]
+    now = start
+    for cycle in range(1, cycles + 1):
+        now += cycle_duration
+        events.append({'time': now, 'run': run_id, 'event': CYCLE, 'cycle': cycle, 'duration': cycle_duration})
+    for event, delay in steps:
+        now += delay
+        events.append({'time': now, 'run': run_id, 'event': event})
+    return events
+
+
+def record_timeline(flowcell_path, transfer_log=None):
+    # timeline of a run folder as far as it can be told from its files: the cycles from Logs/CycleTimes.txt,
+    # RTAComplete.txt, the Demultiplexing folder and, if a TransferLog is given, the transfer
+    run_id = os.path.basename(os.path.normpath(flowcell_path))
+    cycle_times_path = os.path.join(flowcell_path, 'Logs', 'CycleTimes.txt')
+    if not os.path.exists(cycle_times_path):
+        raise RuntimeError('CycleTimes.txt cannot be found in {}'.format(flowcell_path))
+    cycles = [cycle for cycle in CycleTimesParser(cycle_times_path).cycles if cycle['end'] is not None]
+    if not cycles:
+        raise RuntimeError('No completed cycle in {}'.format(cycle_times_path))
+
+    start = cycles[0]['start']
+    def offset(moment):
+        return (moment - start).total_seconds()
+
+    events = [{'time': 0, 'run': run_id, 'event': CREATE}]
+    for cycle in cycles:
+        events.append({'time': offset(cycle['end']), 'run': run_id, 'event': CYCLE, 'cycle': cycle['cycle_number'],
+                       'duration': (cycle['end'] - cycle['start']).total_seconds()})
+    files = [
+        (RTA_COMPLETE, 'RTAComplete.txt', os.path.getmtime),
+        (DEMULTIPLEXING, 'Demultiplexing', os.path.getctime),
+        (DEMULTIPLEXING_DONE, 'Demultiplexing/Stats/ConversionStats.xml', os.path.getmtime),
+    ]
+    for event, path, get_time in files:
+        path = os.path.join(flowcell_path, path)
+        if os.path.exists(path):
+            events.append({'time': offset(datetime.datetime.fromtimestamp(get_time(path))), 'run': run_id, 'event': event})
+    if transfer_log is not None:
+        transfer = transfer_log.get(run_id)
+        if transfer is not None:
+            transfer_started, transfer_done, _ = transfer
+            if transfer_started:
+                events.append({'time': offset(transfer_started), 'run': run_id, 'event': TRANSFER_START})
+            if transfer_done:
+                events.append({'time': offset(transfer_done), 'run': run_id, 'event': TRANSFER_END})
+    return sorted(events, key=lambda event: event['time'])
+
+
+def load_timeline(path):
+    with open(path) as timeline_file:
+        return json.load(timeline_file)
+
+
+def save_timeline(timeline, path):
+    with open(path, 'w') as timeline_file:
+        json.dump(timeline, timeline_file, indent=2)
+
+
+class ReplayClock(object):
+    # timeline seconds since the start of the replay. Waiting for the next event or pass is sped up,
+    # the work of the monitor is not, so that latencies include the real duration of the passes
+    def __init__(self, speed=DEFAULT_SPEED):
+        self._speed = speed
+        self._offset = 0.0
+        self._started = time.time()
+
+    def now(self):
+        return self._offset + time.time() - self._started
+
+    def sleep_until(self, moment):
+        delay = moment - self.now()
+        if delay <= 0:
+            return
+        if self._speed:
+            time.sleep(delay / float(self._speed))
+        self._offset = moment
+        self._started = time.time()
+
+
+class TimelineReplay(object):
+    # plays a timeline into a data folder at accelerated speed while a monitor checks the folder in cron mode
+    # (a new monitor every interval) or in watch mode (one monitor for all passes) and updates a FakeBoard.
+    # For every event with an expected list, results has the latency until the card got there (or, if it
+    # was there already, until the first pass after the event) and the API calls spent on it: the board-wide
+    # calls and the calls for the card made in the meantime. Every list change of the cards is kept, so that
+    # a card moving back, e.g. from Transferring to Sequencing, can be told apart
+    def __init__(self, timeline, template, work_dir, mode=CRON, interval=DEFAULT_INTERVAL, speed=DEFAULT_SPEED, settle=None, config=None):
+        if mode not in MODES:
+            raise RuntimeError('Unknown replay mode {}, use one of {}'.format(mode, ', '.join(MODES)))
+        self._timeline = sorted(timeline, key=lambda event: event['time'])
+        self._template = template
+        self._work_dir = work_dir
+        self._mode = mode
+        self._interval = interval
+        self._speed = speed
+        # how long to keep running passes after the last event, if some transitions are not on the board yet
+        self._settle = settle if settle is not None else 3 * interval
+        self._config = config or {}
+        # initialize None values for @property functions
+        self._clock = None
+        self._board = None
+        self._monitor = None
+        self._epoch = None
+        self._pending = []
+        self._results = []
+        self._passes = []
+
+    @property
+    def data_folder(self):
+        return os.path.join(self._work_dir, 'data')
+
+    @property
+    def transfer_log_path(self):
+        return os.path.join(self._work_dir, 'transfer.tsv')
+
+    @property
+    def config(self):
+        config = {
+            'data_folders': [self.data_folder],
+            'state_dir': os.path.join(self._work_dir, 'state'),
+            'transfer_log': self.transfer_log_path,
+            'hostname': 'replay',
+        }
+        config.update(self._config)
+        return config
+
+    @property
+    def board(self):
+        return self._board
+
+    @property
+    def results(self):
+        return self._results
+
+    @property
+    def passes(self):
+        # (start, duration, API calls) of every pass, in timeline seconds. The passes while no transition
+        # is waiting for the board are not run
+        return self._passes
+
+    def run(self):
+        self._clock = ReplayClock(self._speed)
+        self._board = FakeBoard(clock=self._clock.now)
+        self._monitor = None
+        self._epoch = datetime.datetime.now()
+        self._pending = []
+        self._results = []
+        self._passes = []
+        if not os.path.exists(os.path.join(self.data_folder, 'nosync')):
+            os.makedirs(os.path.join(self.data_folder, 'nosync'))
+
+        events = list(self._timeline)
+        end = events[-1]['time'] + self._settle if events else 0
+        next_pass = 0
+        while events or (self._pending and next_pass <= end):
+            if events and not self._pending and events[0]['time'] > next_pass:
+                # nothing to wait for on the board: skip the idle passes, but keep their schedule
+                next_pass += self._interval * ((events[0]['time'] - next_pass) // self._interval)
+            if events and events[0]['time'] <= next_pass:
+                event = events.pop(0)
+                self._clock.sleep_until(event['time'])
+                self._apply(event)
+            else:
+                self._clock.sleep_until(next_pass)
+                started = self._clock.now()
+                self._run_pass()
+                ended = self._clock.now()
+                if self._mode == CRON:
+                    # cron starts a monitor every interval, the ones started while a pass is running exit
+                    next_pass = (int(ended // self._interval) + 1) * self._interval
+                else:
+                    next_pass = max(started + self._interval, ended)
+        # transitions never seen on the board, e.g. because the next event came before the monitor ran
+        for result in self._pending:
+            self._results.append(result)
+        self._pending = []
+        self._results.sort(key=lambda result: result['applied'])
+        return self._results
+
+    def summary(self):
+        # per event: number played, number seen on the board, mean and max latency and mean API calls
+        events = {}
+        for result in self.results:
+            summary = events.setdefault(result['event'], {'events': 0, 'detected': 0, 'latencies': [], 'calls': []})
+            summary['events'] += 1
+            if result['latency'] is not None:
+                summary['detected'] += 1
+                summary['latencies'].append(result['latency'])
+                summary['calls'].append(sum(result['calls'].values()))
+        for summary in events.values():
+            latencies = summary.pop('latencies')
+            calls = summary.pop('calls')
+            summary['mean_latency'] = sum(latencies) / len(latencies) if latencies else None
+            summary['max_latency'] = max(latencies) if latencies else None
+            summary['mean_calls'] = float(sum(calls)) / len(calls) if calls else None
+        return events
+
+    def list_changes(self, run_id):
+        # (time, list) of every list the card of the run has been put in
+        return [(moment, list_id) for moment, card_name, list_id in self._board.moves if card_name == run_id]
+
+    def backward_moves(self):
+        # (run, time, furthest list, list) of every card moved back to a list before one it has been in
+        backward = []
+        for run_id in sorted(set(card_name for _, card_name, _ in self._board.moves)):
+            furthest = None
+            for moment, list_id in self.list_changes(run_id):
+                if list_id not in LIST_ORDER:
+                    continue
+                if furthest is not None and LIST_ORDER.index(list_id) < LIST_ORDER.index(furthest):
+                    backward.append((run_id, moment, furthest, list_id))
+                else:
+                    furthest = list_id
+        return backward
+
+    def _run_pass(self):
+        if self._monitor is None or self._mode == CRON:
+            self._monitor = FlowcellMonitor(self.config)
+            self._monitor._trello_board = self._board
+        calls = len(self._board.calls)
+        started = self._clock.now()
+        self._monitor.update_trello_board()
+        self._passes.append((started, self._clock.now() - started, len(self._board.calls) - calls))
+        self._check_board()
+
+    def _check_board(self):
+        pending = []
+        for result in self._pending:
+            card = self._board.get_card(result['run'])
+            if card is None or card.list_id != result['expect']:
+                pending.append(result)
+                continue
+            # the call which put the card in the list, or this pass if the card was there before the event
+            moved = self.list_changes(result['run'])[-1][0]
+            result['detected'] = moved if moved > result['applied'] else self._clock.now()
+            result['latency'] = result['detected'] - result['applied']
+            for moment, call, card_name in self._board.history:
+                if result['applied'] < moment <= result['detected'] and card_name in (None, result['run']):
+                    result['calls'][call] = result['calls'].get(call, 0) + 1
+            self._results.append(result)
+        self._pending = pending
+
+    def _apply(self, event):
+        run_id = event['run']
+        if event['event'] not in EVENTS:
+            raise RuntimeError('Unknown event {} in the timeline of {}'.format(event['event'], run_id))
+        getattr(self, '_apply_{}'.format(event['event']))(run_id, event)
+
+        result = {
+            'run': run_id,
+            'event': event['event'],
+            'time': event['time'],
+            'applied': self._clock.now(),
+            'expect': event.get('expect', EXPECTED_LISTS.get(event['event'])),
+            'detected': None,
+            'latency': None,
+            'calls': {},
+        }
+        # an earlier transition of the run which is not on the board yet never will be
+        for previous in [previous for previous in self._pending if previous['run'] == run_id]:
+            self._pending.remove(previous)
+            self._results.append(previous)
+        if result['expect'] is not None:
+            self._pending.append(result)
+        else:
+            self._results.append(result)
+
+    def _timestamp(self, seconds):
+        return self._epoch + datetime.timedelta(seconds=seconds)
+
+    def _run_path(self, run_id):
+        return os.path.join(self.data_folder, run_id)
+
+    def _apply_create(self, run_id, event):
+        flowcell_path = self._run_path(run_id)
+        os.makedirs(flowcell_path)
+        for name in TEMPLATE_FILES:
+            if os.path.exists(os.path.join(self._template, name)):
+                shutil.copy(os.path.join(self._template, name), flowcell_path)
+
+    def _apply_cycle(self, run_id, event):
+        logs_dir = os.path.join(self._run_path(run_id), 'Logs')
+        cycle_times_path = os.path.join(logs_dir, 'CycleTimes.txt')
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
+        lines = []
+        if not os.path.exists(cycle_times_path):
+            lines.append(['Date', 'Time', 'Barcode', 'Cycle', 'Info'])
+        end = self._timestamp(event['time'])
+        start = end - datetime.timedelta(seconds=event.get('duration', 0))
+        barcode = run_id.split('_')[-1][1:]
+        for moment, info in ((start, 'Start Imaging'), (end, 'End Imaging')):
+            date = '{}/{}/{}'.format(moment.month, moment.day, moment.year)
+            lines.append([date, moment.strftime('%H:%M:%S.%f')[:-3], barcode, str(event['cycle']), info])
+        # the format written by the instruments
+        with open(cycle_times_path, 'a') as cycle_times:
+            cycle_times.write(''.join('{}\t\r\n'.format('\t'.join(line)) for line in lines))
+
+    def _apply_rta_complete(self, run_id, event):
+        with open(os.path.join(self._run_path(run_id), 'RTAComplete.txt'), 'w') as rta_complete:
+            rta_complete.write('RTA complete\n')
+
+    def _apply_demultiplexing(self, run_id, event):
+        os.makedirs(os.path.join(self._run_path(run_id), 'Demultiplexing'))
+
+    def _apply_demultiplexing_done(self, run_id, event):
+        stats_dir = os.path.join(self._run_path(run_id), 'Demultiplexing', 'Stats')
+        if not os.path.exists(stats_dir):
+            os.makedirs(stats_dir)
+        with open(os.path.join(stats_dir, 'ConversionStats.xml'), 'w') as conversion_stats:
+            conversion_stats.write('<Stats/>\n')
+
+    def _apply_transfer_started(self, run_id, event):
+        self._log_transfer(run_id, event, TRANSFER_STARTED)
+
+    def _apply_transfer_done(self, run_id, event):
+        self._log_transfer(run_id, event, TRANSFER_DONE)
+
+    def _log_transfer(self, run_id, event, transfer_event):
+        with open(self.transfer_log_path, 'a') as transfer_log:
+            transfer_log.write('{}\t{}\t{}\n'.format(run_id, self._timestamp(event['time']).strftime('%Y-%m-%d %H:%M:%S.%f'), transfer_event))
+
+    def _apply_nosync(self, run_id, event):
+        shutil.move(self._run_path(run_id), os.path.join(self.data_folder, 'nosync', run_id))
+
+    def _apply_delete(self, run_id, event):
+        shutil.rmtree(os.path.join(self.data_folder, 'nosync', run_id))
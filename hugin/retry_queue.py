@@ -0,0 +1,71 @@
+import os
+import json
+import time
+
+from hugin.json_file import write_json
+
+# delays between retries of a failed flowcell, in seconds
+DEFAULT_BASE_DELAY = 5 * 60
+DEFAULT_MAX_DELAY = 24 * 60 * 60
+
+
+class RetryQueue(object):
+    def __init__(self, path, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self._path = path
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        # initialize None values for @property functions
+        self._entries = None
+        self._changed = False
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                with open(self.path) as queue_file:
+                    try:
+                        self._entries = json.load(queue_file)
+                    except ValueError:
+                        # a corrupt queue file only means that flowcells are retried earlier
+                        self._entries = {}
+        return self._entries
+
+    def is_waiting(self, key, now=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        now = time.time() if now is None else now
+        return now < entry['next_attempt']
+
+    def add_failure(self, key, error, now=None):
+        now = time.time() if now is None else now
+        entry = self.entries.get(key, {'attempts': 0, 'first_failure': now})
+        entry['attempts'] += 1
+        # exponential backoff: base, 2*base, 4*base, ... up to max_delay
+        delay = min(self._base_delay * 2 ** (entry['attempts'] - 1), self._max_delay)
+        entry['next_attempt'] = now + delay
+        entry['error'] = str(error)
+        self.entries[key] = entry
+        self._changed = True
+        return entry
+
+    def remove(self, key):
+        if self.entries.pop(key, None) is not None:
+            self._changed = True
+
+    def prune(self, keys):
+        # flowcells which failed and are gone since, e.g. deleted or moved to nosync, are never retried
+        for key in [key for key in self.entries if key not in keys]:
+            del self.entries[key]
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        write_json(self.path, self.entries, indent=2, sort_keys=True)
+        self._changed = False
@@ -0,0 +1,160 @@
+import os
+import csv
+import json
+
+from hugin.json_file import write_json
+
+SAMPLESHEET_FILE = 'SampleSheet.csv'
+
+# column names used by the different sample sheet flavours, in lower case
+LANE_COLUMNS = ['lane']
+SAMPLE_COLUMNS = ['sample_id', 'sampleid']
+PROJECT_COLUMNS = ['sample_project', 'sampleproject', 'project']
+INDEX_COLUMNS = ['index']
+INDEX2_COLUMNS = ['index2']
+
+
+def _column(header, names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def _value(row, column):
+    if column is None or column >= len(row):
+        return ''
+    return row[column].strip()
+
+
+def summarize_samplesheet(path):
+    # reads the sheet line by line and keeps only the per-lane projects, sample counts and index lengths.
+    # Sheets with sections ([Header], [Data], ...) and the old sheets without sections are supported
+    lanes = {}
+    in_data = None
+    header = None
+    with open(path) as samplesheet:
+        for line in samplesheet:
+            line = line.strip()
+            if not line or not line.strip(','):
+                continue
+            if line.startswith('['):
+                in_data = line.lower().startswith('[data]')
+                header = None
+                continue
+            if in_data is None:
+                # the first line is not a section, so the whole sheet is data
+                in_data = True
+            if not in_data:
+                continue
+
+            row = next(csv.reader([line]))
+            if header is None:
+                header = [column.strip().lower() for column in row]
+                lane_column = _column(header, LANE_COLUMNS)
+                sample_column = _column(header, SAMPLE_COLUMNS)
+                project_column = _column(header, PROJECT_COLUMNS)
+                index_column = _column(header, INDEX_COLUMNS)
+                index2_column = _column(header, INDEX2_COLUMNS)
+                continue
+
+            lane = lanes.setdefault(_value(row, lane_column) or '1', {'projects': set(), 'samples': set(), 'index_lengths': set()})
+            lane['projects'].add(_value(row, project_column))
+            lane['samples'].add(_value(row, sample_column))
+            # old-style sheets keep both indexes in one column, e.g. ACAGTG-GTTCAG
+            indexes = [index for value in (_value(row, index_column), _value(row, index2_column)) if value for index in value.split('-')]
+            index_lengths = [len(index) for index in indexes if index]
+            lane['index_lengths'].add('+'.join(str(length) for length in index_lengths) or '0')
+
+    summary = []
+    for lane in sorted(lanes, key=lambda lane: int(lane) if lane.isdigit() else lane):
+        summary.append({
+            'lane': lane,
+            'projects': sorted(project for project in lanes[lane]['projects'] if project),
+            'samples': len(lanes[lane]['samples']),
+            'index_lengths': sorted(lanes[lane]['index_lengths']),
+        })
+    return summary
+
+
+def format_summary(summary):
+    lines = []
+    for lane in summary:
+        lines.append("Lane {lane}: {projects} ({samples} sample{plural}, index {index})".format(
+            lane=lane['lane'],
+            projects=', '.join(lane['projects']) or '-',
+            samples=lane['samples'],
+            plural='' if lane['samples'] == 1 else 's',
+            index='/'.join(lane['index_lengths']),
+        ))
+    return lines
+
+
+class SampleSheetCache(object):
+    # per-run sample sheet summaries, re-read only if mtime or size of the sheet change. The summary last put on
+    # the Trello card is kept as well, so that the description is only updated when the summary changes
+    def __init__(self, path=None):
+        self._path = path
+        # initialize None values for @property functions
+        self._entries = None
+        self._changed = False
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                with open(self.path) as cache_file:
+                    try:
+                        self._entries = json.load(cache_file)
+                    except ValueError:
+                        # all sheets are read again
+                        self._entries = {}
+        return self._entries
+
+    def summary(self, flowcell_path):
+        samplesheet_path = os.path.join(flowcell_path, SAMPLESHEET_FILE)
+        # runs keep their name when they are moved to nosync
+        run_id = os.path.basename(os.path.normpath(flowcell_path))
+        if not os.path.exists(samplesheet_path):
+            return None
+        stat = os.stat(samplesheet_path)
+        entry = self.entries.get(run_id)
+        if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+            entry = self.entries.setdefault(run_id, {'pushed': None})
+            entry.update({
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'summary': summarize_samplesheet(samplesheet_path),
+            })
+            self._changed = True
+        return entry['summary']
+
+    def changed(self, flowcell_path):
+        run_id = os.path.basename(os.path.normpath(flowcell_path))
+        entry = self.entries.get(run_id)
+        return entry is not None and entry['summary'] != entry['pushed']
+
+    def commit(self, flowcell_path):
+        # the current summary is on the board now
+        run_id = os.path.basename(os.path.normpath(flowcell_path))
+        entry = self.entries.get(run_id)
+        if entry is not None and entry['summary'] != entry['pushed']:
+            entry['pushed'] = entry['summary']
+            self._changed = True
+
+    def prune(self, run_ids):
+        # the sheets of runs which have left the data folders are not read again
+        for run_id in [run_id for run_id in self.entries if run_id not in run_ids]:
+            del self.entries[run_id]
+            self._changed = True
+
+    def save(self):
+        if not self._changed or not self.path:
+            return
+        write_json(self.path, self.entries)
+        self._changed = False
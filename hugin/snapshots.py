@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import datetime
+
+from hugin.json_file import write_json
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.expanduser('~'), '.hugin', 'spool')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def format_time(value):
+    return value.strftime(TIME_FORMAT) if value else None
+
+
+def parse_time(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT) if value else None
+
+
+def flowcell_state(flowcell):
+    # the current state of a flowcell as plain json-compatible values
+    return {
+        'name': flowcell.full_name,
+        'server': flowcell.server,
+        'trello_list': flowcell.trello_list,
+        'due_time': format_time(flowcell.due_time),
+        'warning': flowcell.warning,
+    }
+
+
+def flowcell_snapshot(flowcell):
+    # everything needed to put a flowcell on the Trello board
+    snapshot = flowcell_state(flowcell)
+    snapshot['description'] = flowcell.get_formatted_description()
+    return snapshot
+
+
+class FlowcellSnapshot(object):
+    # a flowcell read back from a snapshot, with the attributes FlowcellMonitor uses to update its card
+    def __init__(self, data):
+        self._data = data
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def full_name(self):
+        return self.data['name']
+
+    @property
+    def server(self):
+        return self.data['server']
+
+    @property
+    def trello_list(self):
+        return self.data['trello_list']
+
+    @property
+    def due_time(self):
+        return parse_time(self.data.get('due_time'))
+
+    @property
+    def warning(self):
+        return self.data.get('warning')
+
+    @property
+    def description_changed(self):
+        # snapshots are only synced when they have changed
+        return True
+
+    def get_formatted_description(self):
+        return self.data.get('description') or ''
+
+
+class SnapshotSpool(object):
+    # a directory with one json file per host, holding the snapshots of all flowcells of that host
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def host_path(self, host):
+        return os.path.join(self.path, '{}.json'.format(host))
+
+    def write(self, host, snapshots):
+        data = {
+            'host': host,
+            'time': time.time(),
+            'flowcells': sorted(snapshots, key=lambda snapshot: snapshot['name']),
+        }
+        write_json(self.host_path(host), data, indent=2, sort_keys=True)
+
+    def read_host(self, host):
+        try:
+            with open(self.host_path(host)) as spool_file:
+                return json.load(spool_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def read(self):
+        hosts = {}
+        if not os.path.exists(self.path):
+            return hosts
+        for filename in sorted(os.listdir(self.path)):
+            if not filename.endswith('.json'):
+                continue
+            data = self.read_host(filename[:-len('.json')])
+            if data is not None:
+                hosts[data['host']] = data
+        return hosts
@@ -0,0 +1,180 @@
+import json
+import time
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+# longest time a long-poll request waits for a change, in seconds
+MAX_WAIT = 300
+
+
+class FlowcellStateStore(object):
+    # the flowcell states of the last pass, shared between the monitor and the request threads.
+    # Responses are rendered once per change, so requests never touch the filesystem or Trello
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._flowcells = {}
+        self._metrics = {}
+        self._passes = 0
+        # last-modified time of every resource, by path
+        self._modified = {}
+        self._responses = {}
+
+    def publish(self, flowcells, metrics=None):
+        now = time.time()
+        with self._condition:
+            self._passes += 1
+            for name in set(self._flowcells) | set(flowcells):
+                if self._flowcells.get(name) != flowcells.get(name):
+                    self._modified['/flowcells/{}'.format(name)] = now
+                    self._modified['/flowcells'] = now
+            self._modified['/metrics'] = now
+            self._modified.setdefault('/flowcells', now)
+            self._flowcells = dict(flowcells)
+            self._metrics = dict(metrics or {})
+            self._responses = {}
+            self._condition.notify_all()
+
+    def response(self, path):
+        # (etag, last modified, body) of a resource, None if it does not exist
+        with self._condition:
+            if path not in self._responses:
+                body = self._render(path)
+                if body is None:
+                    return None
+                etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+                self._responses[path] = (etag, self._modified.get(path, time.time()), body)
+            return self._responses[path]
+
+    def wait(self, path, etag, timeout):
+        # wait until the resource no longer has the given etag, returns the new response or None on timeout
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                response = self.response(path)
+                if response is None or response[0] != etag:
+                    return response
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _render(self, path):
+        if path == '/flowcells':
+            flowcells = [self._flowcells[name] for name in sorted(self._flowcells)]
+            return json.dumps({'flowcells': flowcells}, sort_keys=True).encode('utf-8')
+        elif path.startswith('/flowcells/'):
+            flowcell = self._flowcells.get(path[len('/flowcells/'):])
+            if flowcell is None:
+                return None
+            return json.dumps(flowcell, sort_keys=True).encode('utf-8')
+        elif path == '/metrics':
+            return self._render_metrics().encode('utf-8')
+        return None
+
+    def _render_metrics(self):
+        lines = [
+            '# TYPE hugin_passes_total counter',
+            'hugin_passes_total {}'.format(self._passes),
+            '# TYPE hugin_flowcells gauge',
+        ]
+        lists = {}
+        for flowcell in self._flowcells.values():
+            lists[flowcell['trello_list']] = lists.get(flowcell['trello_list'], 0) + 1
+        for trello_list in sorted(lists):
+            lines.append('hugin_flowcells{{list="{}"}} {}'.format(trello_list, lists[trello_list]))
+        for name in sorted(self._metrics):
+            lines.append('# TYPE hugin_{} gauge'.format(name))
+            lines.append('hugin_{} {}'.format(name, self._metrics[name]))
+        return '\n'.join(lines) + '\n'
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    # GET /flowcells, /flowcells/<name> and /metrics with ETag/Last-Modified. A request with If-None-Match
+    # and ?wait=SECONDS is held until the resource changes, instead of being answered with 304 right away
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = unquote(url.path).rstrip('/')
+        store = self.server.store
+
+        response = store.response(path)
+        if response is None:
+            return self._send(404, b'Not found\n', content_type='text/plain')
+
+        etag, last_modified, body = response
+        if self._not_modified(etag, last_modified):
+            try:
+                wait = min(float(parse_qs(url.query).get('wait', ['0'])[0]), MAX_WAIT)
+            except ValueError:
+                wait = 0
+            if wait > 0 and self.headers.get('If-None-Match'):
+                response = store.wait(path, etag, wait)
+            else:
+                response = None
+            if response is None:
+                return self._send(304, None, etag=etag, last_modified=last_modified)
+            etag, last_modified, body = response
+
+        content_type = 'text/plain; version=0.0.4' if path == '/metrics' else 'application/json'
+        self._send(200, body, content_type=content_type, etag=etag, last_modified=last_modified)
+
+    def _not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            since = parsedate_tz(if_modified_since)
+            return since is not None and int(last_modified) <= mktime_tz(since)
+        return False
+
+    def _send(self, code, body, content_type=None, etag=None, last_modified=None):
+        self.send_response(code)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if last_modified is not None:
+            self.send_header('Last-Modified', formatdate(last_modified, usegmt=True))
+        self.send_header('Cache-Control', 'no-cache')
+        if body is not None:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # dashboards poll all the time, do not fill the monitor output with their requests
+        pass
+
+
+class StatusServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        HTTPServer.__init__(self, (host, port), StatusRequestHandler)
+        self.store = store
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='hugin-status-server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,149 @@
+import os
+import json
+import datetime
+
+from hugin.json_file import write_json
+
+DEFAULT_TRANSFER_LOG = os.path.join(os.path.expanduser('~'), '.logs', 'transfer.tsv')
+
+# number of bytes at the beginning of the log used to recognize it
+HEAD_SIZE = 256
+
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+]
+
+# events in the third column of the log. A line without an event means that the transfer is done
+TRANSFER_STARTED = 'started'
+TRANSFER_DONE = 'finished'
+TRANSFER_FAILED = 'failed'
+
+EVENTS = {
+    'started' : TRANSFER_STARTED,
+    'start'   : TRANSFER_STARTED,
+    'finished': TRANSFER_DONE,
+    'done'    : TRANSFER_DONE,
+    ''        : TRANSFER_DONE,
+    'failed'  : TRANSFER_FAILED,
+    'error'   : TRANSFER_FAILED,
+}
+
+
+def parse_timestamp(value):
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+    return None
+
+
+# index of the transfer.tsv log written by the sync tool, one '<run id>\t<timestamp>[\t<event>]' per line.
+# The log is only read from the offset reached in the previous update and the run -> (start, end, status)
+# index is kept in index_path, so every pass costs O(new lines) no matter how long the log is
+class TransferLog(object):
+    def __init__(self, path, index_path=None):
+        self._path = path
+        self._index_path = index_path
+        # initialize None values for @property functions
+        self._index = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {'inode': None, 'head': None, 'offset': 0, 'runs': {}}
+            if self._index_path and os.path.exists(self._index_path):
+                with open(self._index_path) as index_file:
+                    try:
+                        index = json.load(index_file)
+                    except ValueError:
+                        index = None
+                # re-read the log if the index was written for another log file
+                if index and index.get('path') == self.path:
+                    self._index = index
+        return self._index
+
+    def update(self):
+        if not os.path.exists(self.path):
+            return 0
+
+        stat = os.stat(self.path)
+        index = self.index
+        with open(self.path, 'rb') as log_file:
+            # inodes are reused, so the first line tells a rotated log apart as well
+            head = log_file.readline(HEAD_SIZE).decode('utf-8', 'replace')
+            # the log has been rotated or truncated, start from the beginning of the new file
+            if index['inode'] != stat.st_ino or index['head'] != head or stat.st_size < index['offset']:
+                index['inode'] = stat.st_ino
+                index['head'] = head
+                index['offset'] = 0
+            if stat.st_size == index['offset']:
+                return 0
+            log_file.seek(index['offset'])
+            data = log_file.read(stat.st_size - index['offset'])
+        # a line without newline may still be written by the sync tool, leave it for the next update
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].decode('utf-8', 'replace').splitlines()
+        for line in lines:
+            self._add_line(line)
+        index['offset'] += end
+        self._save()
+        return len(lines)
+
+    def get(self, run_id):
+        entry = self.index['runs'].get(run_id)
+        if entry is None:
+            return None
+        start, end, status = entry
+        return parse_timestamp(start) if start else None, parse_timestamp(end) if end else None, status
+
+    def started(self, run_id):
+        entry = self.get(run_id)
+        return entry[0] if entry else None
+
+    def done(self, run_id):
+        entry = self.get(run_id)
+        return entry[1] if entry else None
+
+    def prune(self, run_ids):
+        # transfers of runs which have left the data folders are not asked for again, so the index only
+        # grows with the running runs and saving it stays cheap
+        runs = self.index['runs']
+        gone = [run_id for run_id in runs if run_id not in run_ids]
+        for run_id in gone:
+            del runs[run_id]
+        if gone:
+            self._save()
+        return len(gone)
+
+    def _add_line(self, line):
+        columns = line.rstrip('\r').split('\t')
+        if len(columns) < 2 or parse_timestamp(columns[1].strip()) is None:
+            # header or garbage
+            return
+        run_id = columns[0].strip()
+        timestamp = columns[1].strip()
+        event = EVENTS.get(columns[2].strip().lower() if len(columns) > 2 else '')
+        if event is None:
+            return
+
+        start, end, _ = self.index['runs'].get(run_id, (None, None, None))
+        if event == TRANSFER_STARTED:
+            # a new transfer of the same run starts over
+            start, end = timestamp, None
+        elif event == TRANSFER_DONE:
+            end = timestamp
+        self.index['runs'][run_id] = (start, end, event)
+
+    def _save(self):
+        if not self._index_path:
+            return
+        self.index['path'] = self.path
+        write_json(self._index_path, self.index)
@@ -0,0 +1,55 @@
+import argparse
+import os
+import yaml
+
+from hugin.backfill import FlowcellBackfill, DEFAULT_CHUNKSIZE
+
+CONFIG = {}
+DEFAULT_CONFIG = os.path.join(os.environ['HOME'], '.hugin/config.yaml')
+
+def backfill_flowcells():
+    parser = argparse.ArgumentParser(description="A script that will parse many finished run folders in nosync in parallel and put them on the Trello board, e.g. when adding a data folder or rebuilding the board")
+    parser.add_argument('data_folders', nargs='*', help="Data folders to backfill, by default the ones in the config file")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, action='store', help="Config file with e.g. Trello credentials and options")
+    parser.add_argument('--processes', type=int, default=None, help="Number of worker processes, by default one per CPU")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="Number of run folders handed to a worker at a time")
+    parser.add_argument('--checkpoint', default=None, help="File the parsed runs are written to, an interrupted backfill continues from it")
+    parser.add_argument('--apply', action='store_true', help="Create the missing cards on the Trello board once the run folders are parsed, existing cards are not changed")
+    args = parser.parse_args()
+
+    assert os.path.exists(args.config), "Could not locate config file {}".format(args.config)
+
+    with open(args.config) as config:
+        CONFIG.update(yaml.load(config) or {})
+
+    backfill = FlowcellBackfill(CONFIG, checkpoint_path=args.checkpoint)
+    counts = backfill.parse(args.data_folders, processes=args.processes, chunksize=args.chunksize, progress=report_progress)
+    print("Parsed {parsed} run folder(s), {failed} failed, {skipped} already in {checkpoint}".format(checkpoint=backfill.checkpoint_path, **counts))
+    if not args.apply:
+        return
+
+    # do not race with a monitor updating the same board
+    lease = backfill.lease
+    if not lease.acquire():
+        owner = lease.owner or {}
+        print("Monitor is running on {} (pid {}), run the backfill with --apply again later".format(owner.get('host'), owner.get('pid')))
+        return
+    try:
+        counts = backfill.apply()
+    finally:
+        lease.release()
+    print("Applied {applied} run(s) to the board, {skipped} applied before".format(**counts))
+    for flowcell_path, reason in backfill.skipped:
+        print("  {}: {}".format(flowcell_path, reason))
+
+
+def report_progress(result, counts):
+    if 'error' in result:
+        print("  {path}: {error}".format(**result))
+    done = counts['parsed'] + counts['failed']
+    if done % 100 == 0:
+        print("{} run folder(s) parsed".format(done))
+
+
+if __name__ == "__main__":
+    backfill_flowcells()
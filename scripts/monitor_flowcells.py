@@ -1,8 +1,12 @@
 import argparse
 import os
+import time
 import yaml
 
 from hugin.flowcell_monitor import FlowcellMonitor
+from hugin.collector import FlowcellAgent, FlowcellCollector
+from hugin.status_server import FlowcellStateStore, StatusServer, DEFAULT_HOST, DEFAULT_PORT
+from hugin import profiling
 
 CONFIG = {}
 DEFAULT_CONFIG = os.path.join(os.environ['HOME'], '.hugin/config.yaml')
@@ -10,6 +14,15 @@ DEFAULT_CONFIG = os.path.join(os.environ['HOME'], '.hugin/config.yaml')
 def monitor_flowcells():
     parser = argparse.ArgumentParser(description="A script that will monitor specified run folders and update a Trello board as the status of runs change")
     parser.add_argument('--config', default=DEFAULT_CONFIG, action='store', help="Config file with e.g. Trello credentials and options")
+    parser.add_argument('--queue-followup', action='store_true', help="If another monitor is running on the same board, queue one follow-up run instead of exiting")
+    parser.add_argument('--watch', type=int, metavar='SECONDS', help="Keep running and start a new pass every SECONDS. Serves the flowcell status over HTTP if 'status_server' is in the config file")
+    parser.add_argument('--profile', choices=profiling.PROFILERS, help="Profile each phase of the passes (discovery, flowcell status, XML and cycle time parsing, Trello calls) with cProfile, or by sampling the stack")
+    parser.add_argument('--profile-dir', default=None, help="Folder the profiles are written to, by default profiles/ in the state folder")
+    parser.add_argument('--profile-top', type=int, default=profiling.DEFAULT_TOP, metavar='N', help="Number of hot functions per phase to print at the end")
+    parser.add_argument('--profile-interval', type=float, default=profiling.DEFAULT_INTERVAL, metavar='SECONDS', help="Seconds between two stack samples with --profile sample")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--agent', action='store_true', help="Only write snapshots of the local flowcells to the spool directory of the collector")
+    mode.add_argument('--collector', action='store_true', help="Update the Trello board from the snapshots written by the agents")
     args = parser.parse_args()
 
     assert os.path.exists(args.config), "Could not locate config file {}".format(args.config)
@@ -18,8 +31,77 @@ def monitor_flowcells():
         CONFIG.update(yaml.load(config) or {})
 
 
-    flowcell_monitor = FlowcellMonitor(CONFIG)
-    flowcell_monitor.update_trello_board()
+    if args.agent:
+        flowcell_monitor = FlowcellAgent(CONFIG)
+        run_pass = flowcell_monitor.update_spool
+    elif args.collector:
+        flowcell_monitor = FlowcellCollector(CONFIG)
+        run_pass = flowcell_monitor.update_trello_board
+    else:
+        flowcell_monitor = FlowcellMonitor(CONFIG)
+        run_pass = flowcell_monitor.update_trello_board
+
+    lease = flowcell_monitor.lease
+    if not lease.acquire(watch=bool(args.watch)):
+        owner = lease.owner or {}
+        if args.queue_followup and lease.request_followup():
+            print("Monitor is already running on {} (pid {}), queued a follow-up run".format(owner.get('host'), owner.get('pid')))
+        elif owner.get('watch'):
+            print("Monitor is already running in watch mode on {} (pid {}), exiting".format(owner.get('host'), owner.get('pid')))
+        else:
+            print("Monitor is already running on {} (pid {}), exiting".format(owner.get('host'), owner.get('pid')))
+        return
+
+    store = None
+    server = None
+    if args.watch and 'status_server' in CONFIG:
+        server_config = CONFIG.get('status_server') or {}
+        store = FlowcellStateStore()
+        server = StatusServer(store, host=server_config.get('host', DEFAULT_HOST), port=server_config.get('port', DEFAULT_PORT))
+        server.start()
+
+    profiler = None
+    if args.profile == 'cprofile':
+        profiler = profiling.install(profiling.CProfiler())
+    elif args.profile == 'sample':
+        profiler = profiling.install(profiling.SamplingProfiler(interval=args.profile_interval))
+    if profiler is not None:
+        profiler.start()
+
+    try:
+        while True:
+            started = time.time()
+            report_skipped(run_pass())
+            if store is not None:
+                store.publish(flowcell_monitor.flowcell_states, flowcell_monitor.pass_metrics)
+            if lease.lost:
+                break
+            if args.watch:
+                time.sleep(max(0, args.watch - (time.time() - started)))
+            # run once more if another monitor asked for it while this pass was running
+            elif not lease.take_followup():
+                break
+    finally:
+        if server is not None:
+            server.stop()
+        lease.release()
+        if profiler is not None:
+            report_profile(profiler, args.profile_dir or os.path.join(flowcell_monitor.state_dir, 'profiles'), args.profile_top)
+
+
+def report_skipped(skipped):
+    if skipped:
+        print("Skipped {} flowcell(s) in this pass:".format(len(skipped)))
+        for flowcell_path, reason in skipped:
+            print("  {}: {}".format(flowcell_path, reason))
+
+
+def report_profile(profiler, profile_dir, top):
+    profiler.stop()
+    profiling.uninstall()
+    print(profiler.summary(top))
+    for path in profiler.write(profile_dir):
+        print("Profile written to {}".format(path))
 
 
 if __name__ == "__main__":
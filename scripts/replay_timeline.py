@@ -0,0 +1,68 @@
+import argparse
+import os
+import shutil
+import tempfile
+
+from hugin import replay
+
+def replay_timeline():
+    parser = argparse.ArgumentParser(description="A script that will play the timeline of one or more runs into a temporary data folder while the monitor updates a fake Trello board, and report how long it takes until each transition is on the board and how many API calls it costs")
+    parser.add_argument('template', help="Run folder the RunInfo.xml, runParameters.xml and SampleSheet.csv of the replayed runs are copied from")
+    timeline = parser.add_mutually_exclusive_group()
+    timeline.add_argument('--timeline', default=None, help="JSON file with the timeline to play, by default a synthetic timeline")
+    timeline.add_argument('--record', action='store_true', help="Play the timeline recorded in the files of the template run folder")
+    parser.add_argument('--runs', type=int, default=1, help="Number of synthetic runs")
+    parser.add_argument('--cycles', type=int, default=20, help="Number of cycles of each synthetic run")
+    parser.add_argument('--stagger', type=int, default=30 * 60, metavar='SECONDS', help="Seconds between the starts of the synthetic runs")
+    parser.add_argument('--save-timeline', default=None, help="Write the played timeline to this JSON file")
+    parser.add_argument('--mode', choices=replay.MODES, default=replay.CRON, help="Start a new monitor for every pass as cron does, or keep one monitor as --watch does")
+    parser.add_argument('--interval', type=int, default=replay.DEFAULT_INTERVAL, metavar='SECONDS', help="Seconds between two passes of the monitor, in timeline time")
+    parser.add_argument('--speed', type=float, default=replay.DEFAULT_SPEED, help="How many times faster than real time the timeline is played, 0 to not wait at all")
+    parser.add_argument('--work-dir', default=None, help="Folder for the data folder and the monitor state, by default a temporary folder which is removed afterwards")
+    args = parser.parse_args()
+
+    if args.timeline:
+        events = replay.load_timeline(args.timeline)
+    elif args.record:
+        events = replay.record_timeline(args.template)
+    else:
+        name = os.path.basename(os.path.normpath(args.template)).split('_')
+        events = []
+        for run in range(args.runs):
+            # same date, instrument and flowcell as the template, a new run number
+            run_id = '_'.join(name[:2] + ['{:04d}'.format(run + 1)] + name[3:])
+            events += replay.synthetic_timeline(run_id, cycles=args.cycles, start=run * args.stagger)
+    if args.save_timeline:
+        replay.save_timeline(events, args.save_timeline)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='hugin-replay-')
+    try:
+        timeline_replay = replay.TimelineReplay(events, args.template, work_dir, mode=args.mode, interval=args.interval, speed=args.speed)
+        results = timeline_replay.run()
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+    for result in results:
+        if result['expect'] is None:
+            continue
+        if result['latency'] is None:
+            print("{run} {event}: never on {expect}".format(**result))
+        else:
+            calls = ', '.join('{} {}'.format(count, call) for call, count in sorted(result['calls'].items()))
+            print("{} {}: on {} after {:.1f}s, {}".format(result['run'], result['event'], result['expect'], result['latency'], calls))
+
+    for run_id, moment, furthest, list_id in timeline_replay.backward_moves():
+        print("{} moved back from {} to {} at {:.1f}s".format(run_id, furthest, list_id, moment))
+
+    passes = timeline_replay.passes
+    print("{} passes, {:.3f}s and {:.1f} API calls per pass on average".format(
+        len(passes), sum(duration for _, duration, _ in passes) / max(len(passes), 1), float(sum(calls for _, _, calls in passes)) / max(len(passes), 1)))
+    for event, summary in sorted(timeline_replay.summary().items()):
+        if summary['mean_latency'] is None:
+            continue
+        print("{event}: {detected}/{events} on the board, latency {mean_latency:.1f}s mean, {max_latency:.1f}s max, {mean_calls:.1f} API calls".format(event=event, **summary))
+
+
+if __name__ == "__main__":
+    replay_timeline()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin.backfill import FlowcellBackfill
+from hugin.flowcell_status import FC_STATUSES
+from hugin.fake_trello import FakeBoard
+
+ORIGINAL_FLOWCELL = os.path.join('tests', 'test_data', '150424_ST-E00214_0031_BH2WY7CCXX')
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.data_folder = os.path.join(self.state_dir, 'data')
+        # running runs are left to the monitor
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, '150424_ST-E00214_0029_BH2WY7CCXX'))
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, 'nosync', '150424_ST-E00214_0031_BH2WY7CCXX'))
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, 'nosync', '150424_ST-E00214_0030_AH2WY7CCXX'))
+        # a run folder without runParameters.xml
+        self.broken_flowcell = os.path.join(self.data_folder, 'nosync', '150424_ST-E00214_0032_BBROKENXX')
+        os.mkdir(self.broken_flowcell)
+        self.config = {'state_dir': self.state_dir, 'data_folders': [self.data_folder], 'hostname': 'server-1'}
+
+    def test_parse(self):
+        backfill = FlowcellBackfill(self.config)
+        counts = backfill.parse(processes=2)
+        self.assertEqual((counts['parsed'], counts['failed'], counts['skipped']), (2, 1, 0))
+        snapshots = dict((result['snapshot']['name'], result['snapshot']) for result in backfill.results() if 'snapshot' in result)
+        self.assertEqual(snapshots['150424_ST-E00214_0030_AH2WY7CCXX']['trello_list'], 'Nosync')
+        self.assertEqual(snapshots['150424_ST-E00214_0031_BH2WY7CCXX']['server'], 'server-1')
+
+    def test_resume(self):
+        FlowcellBackfill(self.config).parse(processes=2)
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, 'nosync', '150424_ST-E00214_0033_BFIXEDXX'))
+        shutil.rmtree(self.broken_flowcell)
+
+        counts = FlowcellBackfill(self.config).parse(processes=2)
+        self.assertEqual((counts['parsed'], counts['failed'], counts['skipped']), (1, 0, 2))
+
+    def test_apply_keeps_existing_cards(self):
+        board = FakeBoard()
+        check_status = [card_list for card_list in board.lists if card_list.name == FC_STATUSES['CHECKSTATUS']][0]
+        # the monitor has flagged this run since it was parsed
+        existing = check_status.add_card('150424_ST-E00214_0031_BH2WY7CCXX', 'server-1')
+        backfill = FlowcellBackfill(self.config)
+        backfill.parse(processes=2)
+        backfill._trello_board = board
+        counts = backfill.apply()
+        self.assertEqual(counts['applied'], 2)
+        self.assertEqual(existing.list_id, FC_STATUSES['CHECKSTATUS'])
+        self.assertEqual(board.get_card('150424_ST-E00214_0030_AH2WY7CCXX').list_id, FC_STATUSES['NOSYNC'])
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin.collector import FlowcellAgent, FlowcellCollector
+from hugin.flowcell_status import FC_STATUSES
+from hugin.snapshots import SnapshotSpool
+from hugin.fake_trello import FakeBoard
+
+
+def snapshot(name, server, trello_list):
+    return {'name': name, 'server': server, 'trello_list': trello_list, 'due_time': None, 'warning': None, 'description': server}
+
+
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.config = {'state_dir': self.state_dir, 'spool_dir': os.path.join(self.state_dir, 'spool')}
+        self.spool = SnapshotSpool(self.config['spool_dir'])
+        self.board = FakeBoard()
+
+    def _sync(self):
+        collector = FlowcellCollector(self.config)
+        collector._trello_board = self.board
+        self.board.calls = []
+        self.assertEqual(collector.update_trello_board(), [])
+        return self.board.calls
+
+    def test_sync_agents(self):
+        self.spool.write('server-1', [snapshot('150424_ST-E00214_0031_BH2WY7CCXX', 'server-1', FC_STATUSES['SEQUENCING'])])
+        self.spool.write('server-2', [snapshot('151021_ST-E00144_0013_FAKE', 'server-2', FC_STATUSES['NOSYNC'])])
+        calls = self._sync()
+        self.assertEqual(calls.count('add_card'), 2)
+        self.assertEqual(calls.count('get_labels'), 1)
+        self.assertEqual(sorted(label.name for label in self.board.labels), ['server-1', 'server-2'])
+
+        # nothing has changed, so the board is not even read
+        self.assertEqual(self._sync(), [])
+
+        self.spool.write('server-1', [snapshot('150424_ST-E00214_0031_BH2WY7CCXX', 'server-1', FC_STATUSES['DEMULTIPLEXING'])])
+        calls = self._sync()
+        self.assertEqual(calls.count('change_list'), 1)
+        self.assertEqual(self.board.cards[0].list_id, FC_STATUSES['DEMULTIPLEXING'])
+
+    def test_archive(self):
+        self.spool.write('server-2', [snapshot('151021_ST-E00144_0013_FAKE', 'server-2', FC_STATUSES['NOSYNC'])])
+        self._sync()
+        self.spool.write('server-2', [])
+        self._sync()
+        self.assertEqual(self.board.cards[0].list_id, FC_STATUSES['ARCHIVED'])
+
+    def test_agent_state_per_host(self):
+        agents = [FlowcellAgent(dict(self.config, hostname=hostname)) for hostname in ('server-1', 'server-2')]
+        self.assertEqual([agent.retry_queue.path for agent in agents], [
+            os.path.join(self.state_dir, 'server-1', 'retry_queue.json'),
+            os.path.join(self.state_dir, 'server-2', 'retry_queue.json'),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
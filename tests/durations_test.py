@@ -0,0 +1,66 @@
+import unittest
+import os
+import random
+import shutil
+import datetime
+import tempfile
+
+from hugin.durations import RunningStats, DurationTable, CYCLE, DEMULTIPLEXING, CYCLE_DURATION, DURATIONS, DEFAULT_CYCLE_DURATION
+
+
+class TestDurations(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.table_path = os.path.join(self.state_dir, 'durations.json')
+
+    def test_running_stats(self):
+        stats = RunningStats(0.95)
+        rng = random.Random(1)
+        values = [rng.gauss(600, 60) for _ in range(5000)]
+        for value in values:
+            stats.add(value)
+        values.sort()
+        self.assertAlmostEqual(stats.mean, sum(values) / len(values))
+        self.assertAlmostEqual(stats.quantile, values[int(0.95 * len(values))], delta=10)
+
+    def test_priors(self):
+        table = DurationTable()
+        self.assertEqual(table.expected(CYCLE, 'HiSeqX'), CYCLE_DURATION['HiSeqX'])
+        self.assertEqual(table.expected(CYCLE, 'HiSeq', 'RapidRun'), CYCLE_DURATION['RapidRun'])
+        self.assertEqual(table.expected(CYCLE, 'NovaSeq'), DEFAULT_CYCLE_DURATION)
+        self.assertEqual(table.threshold(DEMULTIPLEXING, 'HiSeqX'), DURATIONS['DEMULTIPLEXING'])
+
+    def test_learned_durations(self):
+        table = DurationTable(self.table_path, min_samples=3)
+        for minutes in [100, 110, 120]:
+            run_id = 'run_{}'.format(minutes)
+            self.assertTrue(table.observe(run_id, DEMULTIPLEXING, 'HiSeqX', None, datetime.timedelta(minutes=minutes)))
+            # the same run completed in a later pass is not counted again
+            self.assertFalse(table.observe(run_id, DEMULTIPLEXING, 'HiSeqX', None, datetime.timedelta(minutes=minutes)))
+        table.save()
+
+        table = DurationTable(self.table_path, min_samples=3)
+        self.assertEqual(table.expected(DEMULTIPLEXING, 'HiSeqX'), datetime.timedelta(minutes=110))
+        self.assertEqual(table.threshold(DEMULTIPLEXING, 'HiSeqX'), datetime.timedelta(minutes=120))
+        # other instruments still use the priors
+        self.assertEqual(table.expected(DEMULTIPLEXING, 'MiSeq'), DURATIONS['DEMULTIPLEXING'])
+
+    def test_prune(self):
+        table = DurationTable(self.table_path)
+        for run_id in ['run_1', 'run_2']:
+            table.observe(run_id, DEMULTIPLEXING, 'HiSeqX', None, datetime.timedelta(hours=2))
+        table.prune(set(['run_2']))
+        table.save()
+
+        table = DurationTable(self.table_path)
+        self.assertEqual(sorted(table.recorded), ['run_2'])
+        # the stats of the pruned run are kept
+        self.assertEqual(table.stats['DEMULTIPLEXING/HiSeqX/'].count, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin.flowcell_monitor import FlowcellMonitor
+from hugin.flowcell_status import FC_STATUSES
+from hugin.fake_trello import FakeBoard
+from hugin.lease import Lease
+
+ORIGINAL_FLOWCELL = os.path.join('tests', 'test_data', '150424_ST-E00214_0031_BH2WY7CCXX')
+
+
+class BrokenBoard(FakeBoard):
+    def all_lists(self):
+        raise IOError('Trello is down')
+
+
+class TestFlowcellMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.data_folder = os.path.join(self.state_dir, 'data')
+        os.makedirs(os.path.join(self.data_folder, 'nosync'))
+        self.config = {'state_dir': self.state_dir, 'data_folders': [self.data_folder], 'hostname': 'server-1'}
+
+    def _monitor(self, board):
+        monitor = FlowcellMonitor(self.config)
+        monitor._trello_board = board
+        return monitor
+
+    def test_archived_cards_are_isolated(self):
+        board = FakeBoard()
+        nosync_list = [card_list for card_list in board.lists if card_list.name == FC_STATUSES['NOSYNC']][0]
+        broken = nosync_list.add_card('150424_ST-E00214_0030_AH2WY7CCXX', 'server-1')
+        deleted = nosync_list.add_card('150424_ST-E00214_0031_BH2WY7CCXX', 'server-1')
+
+        def change_list(list_id):
+            raise IOError('card is locked')
+        broken.change_list = change_list
+
+        skipped = self._monitor(board).update_trello_board()
+        self.assertEqual([key for key, error in skipped], [os.path.join(self.data_folder, 'nosync', broken.name)])
+        self.assertEqual(deleted.list_id, FC_STATUSES['ARCHIVED'])
+
+    def test_board_error_aborts_pass(self):
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX'))
+        monitor = self._monitor(BrokenBoard())
+        skipped = monitor.update_trello_board()
+        self.assertEqual([key for key, error in skipped], ['trello'])
+        # the failure is not charged to the flowcell or the data folder
+        self.assertEqual(monitor.retry_queue.entries, {})
+
+    def test_states_kept_during_outage(self):
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX'))
+        monitor = self._monitor(FakeBoard())
+        monitor.update_trello_board()
+        states = dict(monitor.flowcell_states)
+        self.assertEqual(list(states), ['150424_ST-E00214_0031_BH2WY7CCXX'])
+
+        monitor._trello_board = BrokenBoard()
+        monitor.update_trello_board()
+        # the status endpoint keeps serving the last known state
+        self.assertEqual(monitor.flowcell_states, states)
+
+    def test_carry_over_by_folder(self):
+        monitor = self._monitor(FakeBoard())
+        monitor._skipped = [('/data', 'No such file or directory')]
+        previous = {
+            'run_1': {'name': 'run_1', 'path': '/data/run_1'},
+            'run_2': {'name': 'run_2', 'path': '/data2/run_2'},
+        }
+        current = {}
+        monitor._carry_over_skipped(previous, current)
+        self.assertEqual(sorted(current), ['run_1'])
+
+    def test_card_update_backoff(self):
+        flowcell_path = os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX')
+        shutil.copytree(ORIGINAL_FLOWCELL, flowcell_path)
+        self.config['retry_queue'] = {'base_delay': 0}
+        board = FakeBoard()
+
+        def add_card(name, desc=None):
+            raise IOError('card limit reached')
+        for card_list in board.lists:
+            card_list.add_card = add_card
+
+        monitor = self._monitor(board)
+        for attempts in (1, 2):
+            skipped = monitor.update_trello_board()
+            self.assertEqual([key for key, error in skipped], [flowcell_path])
+            # refreshing the flowcell succeeds, but does not reset the backoff of the card update
+            self.assertEqual(monitor.retry_queue.entries[flowcell_path]['attempts'], attempts)
+
+    def test_retry_entries_of_removed_runs(self):
+        flowcell_path = os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX')
+        os.mkdir(flowcell_path)
+        monitor = self._monitor(FakeBoard())
+        # a run folder without runParameters.xml
+        monitor.update_trello_board()
+        self.assertIn(flowcell_path + '#refresh', monitor.retry_queue.entries)
+
+        shutil.rmtree(flowcell_path)
+        monitor.update_trello_board()
+        self.assertEqual(monitor.retry_queue.entries, {})
+
+    def test_lost_lease_stops_pass(self):
+        shutil.copytree(ORIGINAL_FLOWCELL, os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX'))
+        board = FakeBoard()
+        monitor = self._monitor(board)
+        monitor._lease = Lease(os.path.join(self.state_dir, 'monitor.lease'))
+        # another monitor has taken over the board
+        monitor._lease._lost = True
+        skipped = monitor.update_trello_board()
+        self.assertEqual([key for key, error in skipped], ['lease'])
+        self.assertEqual(board.calls, [])
+        self.assertFalse(os.path.exists(monitor.retry_queue.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import os
+import shutil
+import datetime
+import tempfile
+
+from hugin.flowcell_status import FlowcellStatus, FC_STATUSES
+from hugin.flowcells import HiseqXFlowcell, read_flowcell_cycle_times
+from hugin.flowcell_table import FlowcellTable, INITIAL_CAPACITY
+from hugin.durations import DurationTable, DEMULTIPLEXING
+from hugin.samplesheet import SampleSheetCache
+
+TEST_FLOWCELL = 'tests/test_data/150424_ST-E00214_0031_BH2WY7CCXX'
+# 310 cycles of the test flowcell at their measured average cycle time
+SEQUENCING_DUE = datetime.datetime(2015, 10, 9, 3, 10, 23, 707830)
+
+
+class TestFlowcellTable(unittest.TestCase):
+
+    def setUp(self):
+        self.data_folder = tempfile.mkdtemp()
+        self.flowcell_path = os.path.join(self.data_folder, '150424_ST-E00214_0031_BH2WY7CCXX')
+        os.mkdir(self.flowcell_path)
+        shutil.copytree(os.path.join(TEST_FLOWCELL, 'Logs'), os.path.join(self.flowcell_path, 'Logs'))
+        for name in ('RunInfo.xml', 'runParameters.xml'):
+            shutil.copy(os.path.join(TEST_FLOWCELL, name), self.flowcell_path)
+        self.durations = DurationTable()
+
+    def _table(self):
+        flowcell = HiseqXFlowcell(FlowcellStatus(self.flowcell_path))
+        table = FlowcellTable(server='server-1')
+        index = table.add(os.path.basename(self.flowcell_path), self.flowcell_path, flowcell.instrument_type, flowcell.run_mode, flowcell.number_of_cycles)
+        table.set_status(index, FlowcellStatus(self.flowcell_path))
+        table.set_cycles(index, read_flowcell_cycle_times(self.flowcell_path))
+        return table, table.row(index), flowcell
+
+    def test_sequencing(self):
+        table, row, flowcell = self._table()
+        table.evaluate(self.durations, now=SEQUENCING_DUE - datetime.timedelta(hours=1))
+        self.assertEqual(row.status, FC_STATUSES['SEQUENCING'])
+        # the due time is summed up in float seconds
+        self.assertAlmostEqual((row.due_time - SEQUENCING_DUE).total_seconds(), 0, places=2)
+        self.assertAlmostEqual(row.eta.total_seconds(), 3600, places=2)
+        self.assertIsNone(row.warning)
+
+        # the last cycle is long gone
+        table.evaluate(self.durations)
+        self.assertEqual(row.trello_list, FC_STATUSES['CHECKSTATUS'])
+        self.assertEqual(row.warning, 'Cycle 310 lasts too long.')
+        self.assertEqual(list(table.overdue()), [row.index])
+
+    def test_flowcell_reads_its_row(self):
+        flowcell = HiseqXFlowcell(FlowcellStatus(self.flowcell_path))
+        self.assertAlmostEqual((flowcell.due_time - SEQUENCING_DUE).total_seconds(), 0, places=2)
+        self.assertTrue(flowcell.check_status())
+        self.assertEqual(flowcell.trello_list, FC_STATUSES['CHECKSTATUS'])
+        self.assertEqual(flowcell.warning, 'Cycle 310 lasts too long.')
+
+    def test_demultiplexing(self):
+        os.mkdir(os.path.join(self.flowcell_path, 'Demultiplexing'))
+        table, row, flowcell = self._table()
+        table.evaluate(self.durations, now=datetime.datetime.now())
+        self.assertEqual(row.trello_list, FC_STATUSES['DEMULTIPLEXING'])
+        self.assertEqual(row.due_time, flowcell.status.demultiplexing_started + self.durations.expected(DEMULTIPLEXING, 'HiSeqX'))
+        self.assertIsNone(row.warning)
+        self.assertEqual(row.progress, 1.0)
+
+    def test_finished_demultiplexing(self):
+        os.makedirs(os.path.join(self.flowcell_path, 'Demultiplexing', 'Stats'))
+        open(os.path.join(self.flowcell_path, 'Demultiplexing', 'Stats', 'ConversionStats.xml'), 'w').close()
+        table, row, flowcell = self._table()
+        table.evaluate(self.durations)
+        # the run does not fall back to sequencing and is not overdue
+        self.assertEqual(row.trello_list, FC_STATUSES['DEMULTIPLEXING'])
+        self.assertEqual(row.due_time, flowcell.status.demultiplexing_done)
+        self.assertFalse(row.check_status)
+        self.assertEqual(list(table.overdue()), [])
+
+    def test_cached_description(self):
+        loaded = []
+
+        def load_flowcell(path):
+            loaded.append(path)
+            return HiseqXFlowcell(FlowcellStatus(path), server='server-1', samplesheets=samplesheets)
+        samplesheets = SampleSheetCache()
+        samplesheet_path = os.path.join(self.flowcell_path, 'SampleSheet.csv')
+        shutil.copy(os.path.join(TEST_FLOWCELL, 'SampleSheet.csv'), samplesheet_path)
+        table = FlowcellTable(server='server-1', samplesheets=samplesheets, load_flowcell=load_flowcell)
+        row = table.row(table.add(os.path.basename(self.flowcell_path), self.flowcell_path, 'HiSeqX', None, 300))
+
+        description = row.get_formatted_description()
+        self.assertEqual(row.get_formatted_description(), description)
+        self.assertEqual(len(loaded), 1)
+
+        # a changed sample sheet is rendered again
+        with open(samplesheet_path, 'a') as samplesheet:
+            samplesheet.write('8,Sample_P1775_109,P1775_109,FCB_150423,8:2,ACAGTGAT,P3\n')
+        self.assertNotEqual(row.get_formatted_description(), description)
+        self.assertEqual(len(loaded), 2)
+
+    def test_grow_and_remove(self):
+        table = FlowcellTable()
+        for number in range(INITIAL_CAPACITY + 1):
+            table.add('run-{}'.format(number), '/data/run-{}'.format(number), 'HiSeqX', None, 300)
+        table.evaluate(self.durations)
+        self.assertEqual(len(table), INITIAL_CAPACITY + 1)
+        self.assertEqual(set(table.column('status')), set([0]))
+
+        table.retain(['run-1', 'run-{}'.format(INITIAL_CAPACITY)])
+        self.assertEqual(sorted(row.full_name for row in table.rows()), ['run-1', 'run-{}'.format(INITIAL_CAPACITY)])
+        self.assertEqual(table.path(table.index('run-1')), '/data/run-1')
+        self.assertNotIn('run-0', table)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
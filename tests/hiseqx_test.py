@@ -47,7 +47,8 @@ class TestHiSeqXFlowcells(unittest.TestCase):
 
         fc_status = FlowcellStatus(self.fake_flowcell)
         fc = HiseqXFlowcell(fc_status)
-        self.assertEqual(due_date, fc.due_time)
+        # the due time is summed up in float seconds
+        self.assertAlmostEqual((fc.due_time - due_date).total_seconds(), 0, places=2)
 
         os.remove(os.path.join(self.fake_flowcell, 'RunInfo.xml'))
         shutil.rmtree(logs_dir)
@@ -0,0 +1,115 @@
+import unittest
+import os
+import time
+import shutil
+import struct
+import datetime
+import tempfile
+
+from hugin.interop import read_cycle_times, EXTRACTION_METRICS_FILE, TICKS_1970, TICKS_PER_SECOND
+from hugin.flowcell_status import FlowcellStatus
+from hugin.flowcells import Flowcell, MiseqFlowcell, HiseqFlowcell
+
+# C# DateTime.ToBinary() kind bits of a local time
+LOCAL_KIND = 0x8000000000000000
+
+# MiSeq runParameters.xml has no Setup section
+MISEQ_RUN_PARAMETERS = """<?xml version="1.0"?>
+<RunParameters>
+  <ApplicationName>MiSeq Control Software</ApplicationName>
+  <RunID>151021_M00485_0013_000000000-FAKE</RunID>
+</RunParameters>
+"""
+
+HISEQ_RUN_PARAMETERS = """<?xml version="1.0"?>
+<RunParameters>
+  <Setup>
+    <Flowcell>HiSeq Flow Cell v4</Flowcell>
+    <RunMode>HighOutput</RunMode>
+    <ApplicationName>HiSeq Control Software</ApplicationName>
+  </Setup>
+</RunParameters>
+"""
+
+# 2x151 cycles and an 8 cycle index
+RUN_INFO = """<?xml version="1.0"?>
+<RunInfo Version="2">
+  <Run Id="151021_M00485_0013_000000000-FAKE" Number="13">
+    <Flowcell>000000000-FAKE</Flowcell>
+    <Instrument>M00485</Instrument>
+    <Date>151021</Date>
+    <Reads>
+      <Read Number="1" NumCycles="151" IsIndexedRead="N" />
+      <Read Number="2" NumCycles="8" IsIndexedRead="Y" />
+      <Read Number="3" NumCycles="151" IsIndexedRead="N" />
+    </Reads>
+    <FlowcellLayout LaneCount="2" SurfaceCount="1" SwathCount="1" TileCount="4" />
+  </Run>
+</RunInfo>
+"""
+
+
+def extraction_record(lane, tile, cycle, timestamp):
+    ticks = int(timestamp * TICKS_PER_SECOND) + TICKS_1970
+    return struct.pack('<HHH4f4HQ', lane, tile, cycle, 2.5, 2.5, 2.5, 2.5, 100, 100, 100, 100, ticks | LOCAL_KIND)
+
+
+class TestInterOp(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_flowcell = os.path.join(tempfile.mkdtemp(), '151021_M00485_0013_000000000-FAKE')
+        os.makedirs(os.path.join(self.fake_flowcell, 'InterOp'))
+        self.start = time.mktime(datetime.datetime(2015, 10, 21, 12).timetuple())
+
+        with open(os.path.join(self.fake_flowcell, EXTRACTION_METRICS_FILE), 'wb') as metrics_file:
+            metrics_file.write(struct.pack('<BB', 2, 38))
+            # 12 cycles of 6 minutes on 2 lanes with 4 tiles each, the 13th cycle is half-way extracted
+            for cycle in range(1, 14):
+                tiles = [(lane, tile) for lane in (1, 2) for tile in (1101, 1102, 1103, 1104)]
+                if cycle == 13:
+                    tiles = tiles[:3]
+                for i, (lane, tile) in enumerate(tiles):
+                    metrics_file.write(extraction_record(lane, tile, cycle, self.start + cycle * 360 + i))
+
+    def test_cycle_times(self):
+        cycle_times = read_cycle_times(self.fake_flowcell)
+        self.assertEqual([cycle['cycle_number'] for cycle in cycle_times], list(range(2, 13)))
+        self.assertEqual(cycle_times[-1]['end'], datetime.datetime(2015, 10, 21, 13, 12, 7))
+        self.assertEqual(cycle_times[-1]['end'] - cycle_times[-1]['start'], datetime.timedelta(minutes=6))
+
+    def test_tail(self):
+        # only the last 4 cycles are read, the first of them is cut
+        cycle_times = read_cycle_times(self.fake_flowcell, tail_records=3 + 8 * 3 + 4)
+        self.assertEqual([cycle['cycle_number'] for cycle in cycle_times], [11, 12])
+
+    def test_missing_interop(self):
+        self.assertIsNone(read_cycle_times(os.path.dirname(self.fake_flowcell)))
+
+    def _write_run_files(self, run_parameters):
+        with open(os.path.join(self.fake_flowcell, 'runParameters.xml'), 'w') as run_parameters_file:
+            run_parameters_file.write(run_parameters)
+        with open(os.path.join(self.fake_flowcell, 'RunInfo.xml'), 'w') as run_info_file:
+            run_info_file.write(RUN_INFO)
+
+    def test_init_flowcell(self):
+        self._write_run_files(MISEQ_RUN_PARAMETERS)
+        self.assertIsInstance(Flowcell.init_flowcell(FlowcellStatus(self.fake_flowcell)), MiseqFlowcell)
+        self._write_run_files(HISEQ_RUN_PARAMETERS)
+        flowcell = Flowcell.init_flowcell(FlowcellStatus(self.fake_flowcell))
+        self.assertIsInstance(flowcell, HiseqFlowcell)
+        self.assertEqual(flowcell.run_mode, 'HighOutput')
+
+    def test_due_time_without_cycle_times_file(self):
+        self._write_run_files(MISEQ_RUN_PARAMETERS)
+        self.assertFalse(os.path.exists(os.path.join(self.fake_flowcell, 'Logs', 'CycleTimes.txt')))
+        flowcell = Flowcell.init_flowcell(FlowcellStatus(self.fake_flowcell))
+        # 310 cycles of 6 minutes, counted from the first cycle found in InterOp
+        due_time = datetime.datetime(2015, 10, 21, 12, 0, 7) + 310 * datetime.timedelta(minutes=6)
+        self.assertAlmostEqual((flowcell.due_time - due_time).total_seconds(), 0, places=2)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.fake_flowcell))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from hugin.lease import Lease
+
+
+class TestLease(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.lease_path = os.path.join(self.state_dir, 'monitor-board.lease')
+
+    def test_exclusive(self):
+        first = Lease(self.lease_path)
+        second = Lease(self.lease_path)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+        self.assertFalse(os.path.exists(self.lease_path))
+
+    def test_stale_takeover(self):
+        first = Lease(self.lease_path, ttl=60)
+        self.assertTrue(first.acquire())
+        # pretend the first monitor died without renewing its lease
+        old = time.time() - 120
+        os.utime(self.lease_path, (old, old))
+
+        second = Lease(self.lease_path, ttl=60)
+        self.assertTrue(second.acquire())
+        first.release()
+        self.assertTrue(os.path.exists(self.lease_path))
+        second.release()
+
+    def test_renewed_lease_is_kept(self):
+        first = Lease(self.lease_path, ttl=60)
+        self.assertTrue(first.acquire())
+        old = time.time() - 120
+        os.utime(self.lease_path, (old, old))
+
+        second = Lease(self.lease_path, ttl=60)
+        self.assertTrue(second._is_stale())
+        # the first monitor renews its lease before the second one moves it away
+        os.utime(self.lease_path, None)
+        self.assertFalse(second._take_over())
+        self.assertEqual(first.owner['token'], first._token)
+        self.assertEqual(os.listdir(self.state_dir), ['monitor-board.lease'])
+        first.release()
+
+    def test_single_followup(self):
+        lease = Lease(self.lease_path)
+        self.assertTrue(lease.request_followup())
+        self.assertFalse(lease.request_followup())
+        self.assertTrue(lease.take_followup())
+        self.assertFalse(lease.take_followup())
+
+    def test_leftover_followup_is_cleared(self):
+        # a follow-up queued while the previous holder was finishing its last pass
+        self.assertTrue(Lease(self.lease_path).request_followup())
+        lease = Lease(self.lease_path)
+        self.assertTrue(lease.acquire())
+        self.assertFalse(lease.take_followup())
+        lease.release()
+
+    def test_no_followup_for_watch_mode(self):
+        watching = Lease(self.lease_path)
+        self.assertTrue(watching.acquire(watch=True))
+        self.assertFalse(Lease(self.lease_path).request_followup())
+        self.assertFalse(os.path.exists(watching.followup_path))
+        watching.release()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from hugin import profiling
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+
+    def test_off(self):
+        self.assertIs(profiling.phase('discovery'), profiling.phase('trello.all_cards'))
+        with profiling.phase('discovery'):
+            pass
+
+    def test_cprofile(self):
+        profiler = profiling.install(profiling.CProfiler())
+        with profiling.phase('flowcell_status'):
+            with profiling.phase('xml_parsing'):
+                busy(0.01)
+        profiling.uninstall()
+
+        paths = profiler.write(self.profile_dir)
+        self.assertEqual([os.path.basename(path).rsplit('-', 1)[-1] for path in paths], ['flowcell_status.pstats', 'xml_parsing.pstats'])
+        summary = profiler.summary(top=5)
+        # the nested phase is not counted in the outer one
+        self.assertIn('busy', summary.split('=== xml_parsing ===')[1])
+        self.assertNotIn('busy', summary.split('=== xml_parsing ===')[0])
+
+    def test_sampling(self):
+        profiler = profiling.install(profiling.SamplingProfiler(interval=0.001))
+        profiler.start()
+        with profiling.phase('cycle_times'):
+            busy(0.1)
+        profiler.stop()
+        profiling.uninstall()
+
+        paths = profiler.write(self.profile_dir)
+        self.assertIn('cycle_times.folded', [os.path.basename(path).rsplit('-', 1)[-1] for path in paths])
+        self.assertIn('busy', profiler.summary(top=5))
+
+    def tearDown(self):
+        profiling.uninstall()
+        shutil.rmtree(self.profile_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
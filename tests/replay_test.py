@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin import replay
+from hugin.flowcell_status import FC_STATUSES
+
+TEMPLATE = 'tests/test_data/150424_ST-E00214_0031_BH2WY7CCXX'
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.run_id = '150424_ST-E00214_0031_BH2WY7CCXX'
+
+    def _replay(self, mode):
+        timeline = replay.synthetic_timeline(self.run_id, cycles=3)
+        timeline_replay = replay.TimelineReplay(timeline, TEMPLATE, os.path.join(self.work_dir, mode), mode=mode, interval=300, speed=0)
+        return timeline_replay, timeline_replay.run()
+
+    def test_transitions(self):
+        for mode in replay.MODES:
+            timeline_replay, results = self._replay(mode)
+            detected = [(result['event'], result['expect']) for result in results if result['latency'] is not None]
+            self.assertEqual(detected, [
+                (replay.CREATE, FC_STATUSES['SEQUENCING']),
+                (replay.DEMULTIPLEXING, FC_STATUSES['DEMULTIPLEXING']),
+                (replay.DEMULTIPLEXING_DONE, FC_STATUSES['DEMULTIPLEXING']),
+                (replay.TRANSFER_START, FC_STATUSES['TRANFERRING']),
+                (replay.TRANSFER_END, FC_STATUSES['TRANFERRING']),
+                (replay.NOSYNC, FC_STATUSES['NOSYNC']),
+                (replay.DELETE, FC_STATUSES['ARCHIVED']),
+            ])
+            for result in results:
+                if result['latency'] is not None:
+                    # seen in the first pass after the event
+                    self.assertLess(result['latency'], 300)
+            moves = dict((result['event'], result['calls']) for result in results)
+            self.assertEqual(moves[replay.DEMULTIPLEXING].get('change_list'), 1)
+            self.assertEqual(timeline_replay.board.get_card(self.run_id).list_id, FC_STATUSES['ARCHIVED'])
+            # the card only ever moves forward
+            self.assertEqual(timeline_replay.backward_moves(), [])
+            lists = [list_id for _, list_id in timeline_replay.list_changes(self.run_id)]
+            self.assertEqual([list_id for number, list_id in enumerate(lists) if not number or lists[number - 1] != list_id], replay.LIST_ORDER)
+
+    def test_record_timeline(self):
+        timeline = replay.record_timeline(TEMPLATE)
+        self.assertEqual(timeline[0]['event'], replay.CREATE)
+        cycles = [event for event in timeline if event['event'] == replay.CYCLE]
+        self.assertTrue(cycles)
+        self.assertEqual(cycles, sorted(cycles, key=lambda event: event['time']))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
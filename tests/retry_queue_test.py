@@ -0,0 +1,48 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin.retry_queue import RetryQueue
+
+
+class TestRetryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.state_dir, 'retry_queue.json')
+        self.flowcell = '150424_ST-E00214_0031_BH2WY7CCXX'
+
+    def test_backoff(self):
+        queue = RetryQueue(self.queue_path, base_delay=10, max_delay=35)
+        next_attempts = [queue.add_failure(self.flowcell, RuntimeError('corrupt'), now=100)['next_attempt'] for _ in range(4)]
+        self.assertEqual(next_attempts, [110, 120, 135, 135])
+        self.assertTrue(queue.is_waiting(self.flowcell, now=134))
+        self.assertFalse(queue.is_waiting(self.flowcell, now=135))
+
+    def test_prune(self):
+        queue = RetryQueue(self.queue_path)
+        for key in ('/data/run_1', '/data/run_1#refresh', '/data/run_2'):
+            queue.add_failure(key, RuntimeError('corrupt'), now=100)
+        queue.prune(set(['/data/run_2']))
+        queue.save()
+        self.assertEqual(list(RetryQueue(self.queue_path).entries), ['/data/run_2'])
+
+    def test_persistence(self):
+        queue = RetryQueue(self.queue_path)
+        queue.add_failure(self.flowcell, RuntimeError('corrupt'), now=100)
+        queue.save()
+
+        queue = RetryQueue(self.queue_path)
+        self.assertEqual(queue.entries[self.flowcell]['attempts'], 1)
+        self.assertEqual(queue.entries[self.flowcell]['error'], 'corrupt')
+        queue.remove(self.flowcell)
+        queue.save()
+        self.assertEqual(RetryQueue(self.queue_path).entries, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
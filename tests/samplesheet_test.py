@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from hugin.samplesheet import summarize_samplesheet, format_summary, SampleSheetCache
+
+ORIGINAL_FLOWCELL = os.path.join('tests', 'test_data', '150424_ST-E00214_0031_BH2WY7CCXX')
+
+
+class TestSampleSheet(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.fake_flowcell = os.path.join(self.state_dir, '150424_ST-E00214_0031_BH2WY7CCXX')
+        os.mkdir(self.fake_flowcell)
+        shutil.copy2(os.path.join(ORIGINAL_FLOWCELL, 'SampleSheet.csv'), self.fake_flowcell)
+
+    def test_summary(self):
+        summary = summarize_samplesheet(os.path.join(self.fake_flowcell, 'SampleSheet.csv'))
+        self.assertEqual(len(summary), 8)
+        self.assertEqual(summary[0], {'lane': '1', 'projects': ['J_Lundeberg_14_24'], 'samples': 1, 'index_lengths': ['8']})
+        self.assertEqual(format_summary(summary)[0], 'Lane 1: J_Lundeberg_14_24 (1 sample, index 8)')
+
+    def test_summary_without_sections(self):
+        samplesheet_path = os.path.join(self.fake_flowcell, 'SampleSheet.csv')
+        with open(samplesheet_path, 'w') as samplesheet:
+            samplesheet.write('FCID,Lane,SampleID,SampleRef,Index,Description,Control,Recipe,Operator,SampleProject\n')
+            samplesheet.write('C6L1WANXX,1,P1_101,hg19,ACAGTG-GTTCAG,,N,,,P1\n')
+            samplesheet.write('C6L1WANXX,1,P2_101,hg19,GCCAAT-ACCGTA,,N,,,P2\n')
+        summary = summarize_samplesheet(samplesheet_path)
+        self.assertEqual(summary, [{'lane': '1', 'projects': ['P1', 'P2'], 'samples': 2, 'index_lengths': ['6+6']}])
+
+    def test_cache(self):
+        cache_path = os.path.join(self.state_dir, 'samplesheets.json')
+        cache = SampleSheetCache(cache_path)
+        summary = cache.summary(self.fake_flowcell)
+        self.assertTrue(cache.changed(self.fake_flowcell))
+        cache.commit(self.fake_flowcell)
+        cache.save()
+
+        cache = SampleSheetCache(cache_path)
+        self.assertEqual(cache.summary(self.fake_flowcell), summary)
+        self.assertFalse(cache.changed(self.fake_flowcell))
+
+        with open(os.path.join(self.fake_flowcell, 'SampleSheet.csv'), 'a') as samplesheet:
+            samplesheet.write('1,Sample_P1775_148,P1775_148,FCB_150423,1:1,GAATTCGA,J_Lundeberg_14_24\n')
+        self.assertEqual(cache.summary(self.fake_flowcell)[0]['samples'], 2)
+        self.assertTrue(cache.changed(self.fake_flowcell))
+
+    def test_prune(self):
+        cache_path = os.path.join(self.state_dir, 'samplesheets.json')
+        cache = SampleSheetCache(cache_path)
+        cache.summary(self.fake_flowcell)
+        cache.prune(set(['150424_ST-E00214_0030_AH2WY7CCXX']))
+        cache.save()
+        self.assertEqual(SampleSheetCache(cache_path).entries, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
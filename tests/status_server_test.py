@@ -0,0 +1,72 @@
+import unittest
+import time
+import json
+import threading
+
+try:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, Request, HTTPError
+
+from hugin.status_server import FlowcellStateStore, StatusServer
+
+
+def flowcell(name, trello_list):
+    return {'name': name, 'server': 'server-1', 'trello_list': trello_list, 'due_time': None, 'warning': None}
+
+
+class TestStatusServer(unittest.TestCase):
+
+    def setUp(self):
+        self.store = FlowcellStateStore()
+        self.store.publish({'FC1': flowcell('FC1', 'Sequencing')}, {'pass_duration_seconds': 1.5})
+        self.server = StatusServer(self.store, port=0)
+        self.server.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def _get(self, path, headers=None):
+        try:
+            response = urlopen(Request(self.url + path, headers=headers or {}))
+        except HTTPError as e:
+            return e.code, e.headers, None
+        return response.getcode(), response.headers, response.read()
+
+    def test_flowcells(self):
+        code, headers, body = self._get('/flowcells/FC1')
+        self.assertEqual(code, 200)
+        self.assertEqual(json.loads(body.decode('utf-8'))['trello_list'], 'Sequencing')
+        self.assertEqual(self._get('/flowcells/FC2')[0], 404)
+
+        code, _, _ = self._get('/flowcells/FC1', {'If-None-Match': headers['ETag']})
+        self.assertEqual(code, 304)
+        code, _, _ = self._get('/flowcells', {'If-Modified-Since': headers['Last-Modified']})
+        self.assertEqual(code, 304)
+
+    def test_metrics(self):
+        code, _, body = self._get('/metrics')
+        self.assertIn('hugin_flowcells{list="Sequencing"} 1', body.decode('utf-8'))
+        self.assertIn('hugin_pass_duration_seconds 1.5', body.decode('utf-8'))
+
+    def test_long_poll(self):
+        _, headers, _ = self._get('/flowcells/FC1')
+        publisher = threading.Timer(0.2, self.store.publish, [{'FC1': flowcell('FC1', 'Demultiplexing')}])
+        publisher.start()
+        started = time.time()
+        code, _, body = self._get('/flowcells/FC1?wait=10', {'If-None-Match': headers['ETag']})
+        self.assertEqual(code, 200)
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(json.loads(body.decode('utf-8'))['trello_list'], 'Demultiplexing')
+
+        # a pass without changes does not end the wait
+        _, headers, _ = self._get('/flowcells/FC1')
+        self.store.publish({'FC1': flowcell('FC1', 'Demultiplexing')})
+        code, _, _ = self._get('/flowcells/FC1?wait=0.5', {'If-None-Match': headers['ETag']})
+        self.assertEqual(code, 304)
+
+    def tearDown(self):
+        self.server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
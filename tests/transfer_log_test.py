@@ -0,0 +1,76 @@
+import unittest
+import os
+import shutil
+import datetime
+import tempfile
+
+from hugin.transfer_log import TransferLog
+from hugin.flowcell_status import FlowcellStatus, FC_STATUSES
+
+
+class TestTransferLog(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.log_dir, 'transfer.tsv')
+        self.index_path = os.path.join(self.log_dir, 'transfer_log.json')
+        self.flowcell = '150424_ST-E00214_0031_BH2WY7CCXX'
+
+    def _append(self, text):
+        with open(self.log_path, 'a') as log_file:
+            log_file.write(text)
+
+    def test_incremental_update(self):
+        self._append('{}\t2015-04-26 10:00:00\tstarted\n'.format(self.flowcell))
+        transfer_log = TransferLog(self.log_path, index_path=self.index_path)
+        self.assertEqual(transfer_log.update(), 1)
+        self.assertEqual(transfer_log.started(self.flowcell), datetime.datetime(2015, 4, 26, 10))
+        self.assertIsNone(transfer_log.done(self.flowcell))
+
+        # the unfinished line is read once the sync tool has written all of it
+        self._append('{}\t2015-04-26 18:30:00'.format(self.flowcell))
+        transfer_log = TransferLog(self.log_path, index_path=self.index_path)
+        self.assertEqual(transfer_log.update(), 0)
+        self._append('\n')
+        self.assertEqual(transfer_log.update(), 1)
+        self.assertEqual(transfer_log.done(self.flowcell), datetime.datetime(2015, 4, 26, 18, 30))
+
+    def test_rotated_log(self):
+        self._append('{}\t2015-04-26 10:00:00\tstarted\n'.format(self.flowcell))
+        transfer_log = TransferLog(self.log_path, index_path=self.index_path)
+        transfer_log.update()
+        os.remove(self.log_path)
+        self._append('{}\t2015-04-26 18:30:00\tfinished\n'.format(self.flowcell))
+        transfer_log.update()
+        self.assertEqual(transfer_log.get(self.flowcell), (datetime.datetime(2015, 4, 26, 10), datetime.datetime(2015, 4, 26, 18, 30), 'finished'))
+
+    def test_prune(self):
+        self._append('{}\t2015-04-26 10:00:00\tstarted\n'.format(self.flowcell))
+        self._append('150424_ST-E00214_0030_AH2WY7CCXX\t2015-04-25 10:00:00\n')
+        transfer_log = TransferLog(self.log_path, index_path=self.index_path)
+        transfer_log.update()
+        self.assertEqual(transfer_log.prune(set([self.flowcell])), 1)
+
+        # the pruned run is not read again from the log
+        transfer_log = TransferLog(self.log_path, index_path=self.index_path)
+        self.assertEqual(transfer_log.update(), 0)
+        self.assertEqual(list(transfer_log.index['runs']), [self.flowcell])
+
+    def test_finished_transfer_status(self):
+        flowcell_path = os.path.join(self.log_dir, self.flowcell)
+        os.makedirs(os.path.join(flowcell_path, 'Demultiplexing'))
+        # only the end of the transfer has been logged
+        self._append('{}\t2015-04-26 18:30:00\n'.format(self.flowcell))
+        transfer_log = TransferLog(self.log_path)
+        transfer_log.update()
+        status = FlowcellStatus(flowcell_path, transfer_log=transfer_log)
+        self.assertEqual(status.transfering_done, datetime.datetime(2015, 4, 26, 18, 30))
+        # a finished transfer does not send the run back to sequencing
+        self.assertEqual(status.status, FC_STATUSES['TRANFERRING'])
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()